@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# *-* coding: utf-8 *-*
+
+'''
+Compare the previous per-layout slicing downmix of WaveIODevice.convert with
+the coefficient matrix used now, on blocks of the size decoded when streaming.
+'''
+
+import os
+import sys
+import timeit
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from samplebrowsesrc.decoder import streamBlockSize
+from samplebrowsesrc.player import downmixMatrix
+
+
+def sliceDownmix(waveData, channels):
+    #previous implementation, with the 6 channel typo fixed so that it can run
+    if channels == 1:
+        waveData = waveData.repeat(2, axis=1)/2
+    elif channels == 2:
+        pass
+    elif channels == 3:
+        front = waveData[:, [0, 1]]/1.5
+        center = waveData[:, [2]].repeat(2, axis=1)/2
+        waveData = front + center
+    elif channels == 4:
+        front = waveData[:, [0, 1]]/2
+        rear = waveData[:, [2, 3]]/2
+        waveData = front + rear
+    elif channels == 5:
+        front = waveData[:, [0, 1]]/2.5
+        rear = waveData[:, [2, 3]]/2.5
+        center = waveData[:, [4]].repeat(2, axis=1)/2
+        waveData = front + rear + center
+    elif channels == 6:
+        front = waveData[:, [0, 1]]/3
+        rear = waveData[:, [2, 3]]/3
+        center = waveData[:, [4]].repeat(2, axis=1)/2
+        sub = waveData[:, [5]].repeat(2, axis=1)/2
+        waveData = front + rear + center + sub
+    return waveData
+
+
+def main():
+    repeat = 50
+    print('{:>8} {:>12} {:>12} {:>8} {:>10}'.format('channels', 'slice (ms)', 'matrix (ms)', 'speedup', 'max diff'))
+    for channels in (1, 3, 4, 5, 6, 7, 8):
+        block = np.random.uniform(-1, 1, (streamBlockSize, channels)).astype('float32')
+        matrix = downmixMatrix(channels)
+        bulk = min(timeit.repeat(lambda: block.dot(matrix), number=1, repeat=repeat)) * 1000
+        if channels <= 6:
+            loop = min(timeit.repeat(lambda: sliceDownmix(block, channels), number=1, repeat=repeat)) * 1000
+            diff = np.abs(sliceDownmix(block, channels) - block.dot(matrix)).max()
+            print('{:>8} {:>12.3f} {:>12.3f} {:>7.1f}x {:>10.2g}'.format(channels, loop, bulk, loop / bulk, diff))
+        else:
+            print('{:>8} {:>12} {:>12.3f} {:>8} {:>10}'.format(channels, '-', bulk, '-', '-'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+# *-* coding: utf-8 *-*
+
+'''
+Compare soundfile.info with the header parser of samplebrowsesrc.probe, in
+files probed per second, on short samples of the formats it reads directly.
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import timeit
+import numpy as np
+import soundfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from samplebrowsesrc.probe import sampleInfo
+
+
+def createFiles(dirPath, format, subtype, count):
+    filePaths = []
+    for index in range(count):
+        filePath = os.path.join(dirPath, '{}_{}_{}.{}'.format(format, subtype, index, format.lower()))
+        soundfile.write(filePath, np.random.uniform(-.5, .5, (4410 + index, 2)), 44100, subtype=subtype, format=format)
+        filePaths.append(filePath)
+    return filePaths
+
+
+def main():
+    count = 200
+    repeat = 5
+    dirPath = tempfile.mkdtemp()
+    try:
+        print('{:>16} {:>16} {:>16} {:>8}'.format('format', 'soundfile (f/s)', 'header (f/s)', 'speedup'))
+        for format, subtype in (('WAV', 'PCM_16'), ('WAV', 'FLOAT'), ('WAVEX', 'PCM_24'), ('AIFF', 'PCM_16'), ('FLAC', 'PCM_16'), ('FLAC', 'PCM_24')):
+            filePaths = createFiles(dirPath, format, subtype, count)
+            for filePath in filePaths:
+                ref = soundfile.info(filePath)
+                info = sampleInfo(filePath)
+                assert (info.frames, info.samplerate, info.channels, info.format, info.subtype) == \
+                    (ref.frames, ref.samplerate, ref.channels, ref.format, ref.subtype)
+            current = min(timeit.repeat(lambda: [soundfile.info(filePath) for filePath in filePaths], number=1, repeat=repeat))
+            header = min(timeit.repeat(lambda: [sampleInfo(filePath) for filePath in filePaths], number=1, repeat=repeat))
+            print('{:>16} {:>16.0f} {:>16.0f} {:>7.1f}x'.format(
+                '{} {}'.format(format, subtype), count / current, count / header, current / header))
+    finally:
+        shutil.rmtree(dirPath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+# *-* coding: utf-8 *-*
+
+'''
+Compare the per-point lineTo() waveform construction with the bulk QPolygonF
+envelope used by WaveScene, at 5 points per pixel as in WaveScene.drawWave.
+'''
+
+import os
+import sys
+import timeit
+import numpy as np
+from PyQt5 import QtGui
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from samplebrowsesrc.widgets.waveview import envelopePath
+
+
+def loopPath(mins, maxs):
+    path = QtGui.QPainterPath()
+    path.moveTo(0, 0)
+    pos = 0
+    for value in maxs:
+        path.lineTo(pos, value)
+        pos += 1
+    path.lineTo(pos, 0)
+    path.moveTo(0, 0)
+    pos = 0
+    for value in mins:
+        path.lineTo(pos, value)
+        pos += 1
+    path.lineTo(pos, 0)
+    path.closeSubpath()
+    return path
+
+
+def main():
+    repeat = 20
+    print('{:>8} {:>12} {:>12} {:>8}'.format('width', 'loop (ms)', 'bulk (ms)', 'speedup'))
+    for width in (1024, 4096, 16384):
+        points = width * 5
+        maxs = np.random.uniform(0, 1, points).astype('float32')
+        mins = -np.random.uniform(0, 1, points).astype('float32')
+        loop = min(timeit.repeat(lambda: loopPath(mins, maxs), number=1, repeat=repeat)) * 1000
+        bulk = min(timeit.repeat(lambda: envelopePath(mins, maxs), number=1, repeat=repeat)) * 1000
+        print('{:>8} {:>12.3f} {:>12.3f} {:>7.1f}x'.format(width, loop, bulk, loop / bulk))
+
+
+if __name__ == '__main__':
+    main()
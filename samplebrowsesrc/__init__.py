@@ -4,12 +4,19 @@
 import sys
 import os
 import sqlite3
+from threading import Event
 #from math import log
 from PyQt5 import QtCore, QtGui, QtMultimedia, QtWidgets, uic
 import soundfile
 
 import samplebrowsesrc.icons
 from samplebrowsesrc.sampledb import *
+from samplebrowsesrc.peakcache import *
+from samplebrowsesrc.decoder import *
+from samplebrowsesrc.waveloader import *
+from samplebrowsesrc.preview import *
+from samplebrowsesrc.probe import *
+from samplebrowsesrc.watcher import *
 from samplebrowsesrc.player import *
 from samplebrowsesrc.widgets import *
 from samplebrowsesrc.constants import *
@@ -28,6 +35,9 @@ class SampleBrowse(QtWidgets.QMainWindow):
         self.player = Player(self, self.settings.value('AudioDevice'), self.settings.value('SampleRateConversion', 'sinc_fastest'))
         self.player.stopped.connect(self.stopped)
         self.player.output.notify.connect(self.movePlayhead)
+        audioCache.setMaxBytes(self.settings.value('audioCacheSize', defaultAudioCacheSize, type=int) * 1048576)
+        self.prefetchNext = self.settings.value('prefetchNext', 3, type=int)
+        self.prefetchPrevious = self.settings.value('prefetchPrevious', 1, type=int)
         self.sampleSize = self.player.sampleSize
         self.sampleRate = self.player.sampleRate
 
@@ -110,6 +120,17 @@ class SampleBrowse(QtWidgets.QMainWindow):
                     self.settings.remove('dbPath')
                 break
         self.tagColorsDict = self.sampleDb.tagColorsDict
+        self.peakCache = PeakCache('{}.peaks'.format(self.sampleDb.dbFile.absoluteFilePath()))
+        self.waveLoader = WaveLoader(self.peakCache, self.player, self)
+        self.waveLoader.previewLoaded.connect(self.previewLoaded)
+        self.waveLoader.loaded.connect(self.waveLoaded)
+        self.waveLoader.peaksLoaded.connect(self.peaksLoaded)
+        self.waveLoader.failed.connect(self.waveLoadFailed)
+        self.previewPool = QtCore.QThreadPool(self)
+        self.previewPool.setMaxThreadCount(1)
+        self.previewStop = Event()
+        #path of the sample that is playing from its database preview
+        self.previewPlaying = None
 
         self.dbSplitter = AdvancedSplitter(QtCore.Qt.Vertical)
         self.browserStackedLayout.addWidget(self.dbSplitter)
@@ -147,14 +168,17 @@ class SampleBrowse(QtWidgets.QMainWindow):
             self.dbDirView.header().setSectionResizeMode(1, QtWidgets.QHeaderView.ResizeToContents), 
             ] if self.dbDirModel.rowCount() else None)
         self.dbDirModel.updateTree()
+        self.dbWatcher = None
+        self.dbDirModel.loaded.connect(self.updateWatchedDirs)
+        self.setDbWatch()
 
         self.dbSplitter.setStretchFactor(0, 50)
         self.dbSplitter.setStretchFactor(1, 1)
 
         self.browseSelectGroup.buttonClicked[int].connect(self.toggleBrowser)
         self.browseModel = QtGui.QStandardItemModel()
-        self.dbModel = QtGui.QStandardItemModel()
-        self.dbProxyModel = SampleSortFilterProxyModel()
+        self.dbModel = SampleTableModel(self.sampleDb)
+        self.dbProxyModel = SampleFilterProxyModel()
         self.dbProxyModel.setSourceModel(self.dbModel)
         self.sampleView.setModel(self.browseModel)
         self.alignCenterDelegate = AlignItemDelegate(QtCore.Qt.AlignCenter)
@@ -200,7 +224,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
         self.filterStackedLayout.addWidget(self.browsePathLbl)
         self.filterWidget = MainFilterWidget()
         self.statusBar.addHoverWidget(self.filterWidget)
-        self.filterWidget.filtersChanged.connect(self.dbProxyModel.setFilterData)
+        self.filterWidget.filtersChanged.connect(self.dbFiltersChanged)
         self.filterStackedLayout.addWidget(self.filterWidget)
 
         self.audioInfoTabWidget.tagsApplied.connect(self.tagsApplied)
@@ -292,6 +316,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
                 browseRefresh = True
         if settingsDialog.dbCleared:
             self.reloadTags()
+            self.dbDirModel.updateTree()
             browseRefresh = True
             self.browseDb(refresh=True)
         self.browse(refresh=browseRefresh, dbRefresh=dbRefresh)
@@ -299,6 +324,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
             self.settings.value('dbBackup', True, type=bool), 
             self.settings.value('dbBackupInterval', 5, type=int) * 60000, 
             )
+        self.setDbWatch()
 
     def showStats(self):
         StatsDialog(self).exec_()
@@ -315,6 +341,11 @@ class SampleBrowse(QtWidgets.QMainWindow):
         self.quit()
 
     def quit(self):
+        self.previewStop.set()
+        if self.dbWatcher is not None:
+            self.dbWatcher.close()
+        self.waveLoader.cancel()
+        self.dbModel.cancelPage()
         self.settings.setValue('previousVolume', self.volumeSlider.value())
         self.settings.setValue('previousView', self.browseSelectGroup.checkedId())
         self.settings.setValue('lastGeometry', self.geometry())
@@ -401,7 +432,8 @@ class SampleBrowse(QtWidgets.QMainWindow):
 
     def sampleViewKeyPressEvent(self, event):
         if event.key() == QtCore.Qt.Key_Space:
-            if not self.player.isActive():
+            #currentSampleIndex is also set while the sample is still being decoded
+            if not (self.player.isActive() or self.currentSampleIndex):
                 if self.sampleView.currentIndex().isValid():
                     self.play(self.sampleView.currentIndex())
                     self.sampleView.setCurrentIndex(self.sampleView.currentIndex())
@@ -423,7 +455,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
                             else:
                                 next = next.sibling(next.row() - 1, 0)
                             try:
-                                soundfile.info(next.data(FilePathRole))
+                                sampleInfo(next.data(FilePathRole))
                                 break
                             except:
                                 pass
@@ -438,7 +470,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
                             else:
                                 next = next.sibling(next.row() + 1, 0)
                             try:
-                                soundfile.info(next.data(FilePathRole))
+                                sampleInfo(next.data(FilePathRole))
                                 break
                             except:
                                 pass
@@ -502,16 +534,29 @@ class SampleBrowse(QtWidgets.QMainWindow):
         sampleRates = scanOptionsDialog.getSampleRates()
         channels = scanOptionsDialog.channelsCombo.currentIndex()
         scanLimits = scanOptionsDialog.getScanLimits()
-        res = ImportDialogScan(self, dirPath, scanMode, formats, sampleRates, channels, scanLimits).exec_()
+        scanDialog = ImportDialogScan(self, dirPath, scanMode, formats, sampleRates, channels, scanLimits)
+        res = scanDialog.exec_()
+        #known samples are updated and missing ones are found by the scan,
+        #even if nothing is imported
+        if scanDialog.changedSamples:
+            self.applyChangedSamples(scanDialog.changedSamples)
+        if scanDialog.missingPaths:
+            self.removeMissingSamples(scanDialog.missingPaths)
         if not res:
             return
         fileNameList = []
+        filePathList = []
+        newPaths = []
+        tagDelta = TagDelta()
         for filePath, fileName, info, tags in res:
             fileNameList.append(fileName)
-            self._addSampleToDb(filePath, fileName, info, ','.join(tags))
+            filePathList.append(filePath)
+            if self._addSampleToDb(filePath, fileName, info, ','.join(tags), tagDelta=tagDelta):
+                newPaths.append(filePath)
         self.sampleDb.commit()
-        self.reloadTags()
-        self.dbDirModel.updateTree()
+        self.buildPreviews(filePathList)
+        self.applyTagDelta(tagDelta)
+        self.dbDirModel.addPaths(newPaths)
         if self.sampleView.model() == self.browseModel and self.currentBrowseDir and dirPath in self.currentBrowseDir.absolutePath():
             for fileName in fileNameList:
                 match = self.browseModel.match(self.browseModel.index(0, 0), QtCore.Qt.DisplayRole, fileName, flags=QtCore.Qt.MatchExactly)
@@ -604,9 +649,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
     def setIndexReadable(self, fileIndex, readable):
         if not fileIndex.column() == 0:
             fileIndex = fileIndex.sibling(fileIndex.row(), 0)
-        model = fileIndex.model()
-        item = model.itemFromIndex(fileIndex)
-        utils.setItalic(item, not readable)
+        utils.setItalic(fileIndex, not readable)
         if not readable:
             self.audioInfoTabWidget.clear()
     
@@ -627,7 +670,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
             if dbRefresh:
                 for row in range(self.browseModel.rowCount()):
                     fileItem = self.browseModel.item(row, 0)
-                    self.sampleDb.execute('SELECT * FROM samples WHERE filePath=?', (fileItem.data(FilePathRole), ))
+                    self.sampleDb.execute('SELECT rowid FROM samples WHERE filePath=?', (fileItem.data(FilePathRole), ))
                     utils.setBold(fileItem, True if self.sampleDb.fetchall() else False)
             return
         self.currentBrowseDir = path
@@ -645,14 +688,14 @@ class SampleBrowse(QtWidgets.QMainWindow):
             filePath = fileInfo.absoluteFilePath()
             fileName = fileInfo.fileName()
             fileItem = QtGui.QStandardItem(fileName)
-            self.sampleDb.execute('SELECT * FROM samples WHERE filePath=?', (filePath, ))
+            self.sampleDb.execute('SELECT rowid FROM samples WHERE filePath=?', (filePath, ))
             if self.sampleDb.fetchall():
                 utils.setBold(fileItem)
             fileItem.setData(filePath, FilePathRole)
             try:
                 if not scanAll:
                     assert fileInfo.completeSuffix() in availableFormats
-                info = soundfile.info(filePath)
+                info = sampleInfo(filePath)
                 fileItem.setData(info, InfoRole)
                 fileItem.setIcon(QtGui.QIcon.fromTheme('media-playback-start'))
                 dirItem = QtGui.QStandardItem(fileInfo.absolutePath())
@@ -701,7 +744,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
         addToDatabaseAction = QtWidgets.QAction('Add "{}" to database'.format(fileName), menu)
         editTagsAction = QtWidgets.QAction('Edit "{}" tags...'.format(fileName), menu)
         delFromDatabaseAction = QtWidgets.QAction('Remove "{}" from database'.format(fileName), menu)
-        self.sampleDb.execute('SELECT * FROM samples WHERE filePath=?', (filePath, ))
+        self.sampleDb.execute('SELECT rowid FROM samples WHERE filePath=?', (filePath, ))
         if self.sampleView.model() == self.browseModel and not self.sampleDb.fetchone():
             menu.addAction(addToDatabaseAction)
         else:
@@ -715,18 +758,20 @@ class SampleBrowse(QtWidgets.QMainWindow):
             utils.setBold(fileIndex, True)
         elif res == delFromDatabaseAction:
             filePath = fileIndex.data(FilePathRole)
+            tagDelta = TagDelta()
+            tagDelta.update(self.sampleDb.sampleTags(filePath), None)
             self.sampleDb.execute(
                 'DELETE FROM samples WHERE filePath=?', 
                 (filePath, )
                 )
             self.sampleDb.commit()
-            self.reloadTags()
+            self.applyTagDelta(tagDelta)
             if self.sampleView.model() == self.dbProxyModel:
-                self.dbModel.takeRow(fileIndex.row())
+                self.dbModel.removeRow(self.dbProxyModel.mapToSource(fileIndex).row())
             else:
                 utils.setBold(fileIndex, False)
                 self.sampleDbUpdated = True
-            self.dbDirModel.updateTree()
+            self.dbDirModel.removePaths([filePath])
             self.statusBar.addMessage(StatusSamplesRemoved, 1)
         elif res == editTagsAction:
             self.editTags(fileIndex.sibling(fileIndex.row(), tagsColumn))
@@ -738,7 +783,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
         fileIndexList = self.sampleView.selectionModel().selectedRows()
         for fileIndex in fileIndexList:
             filePath = fileIndex.data(FilePathRole)
-            self.sampleDb.execute('SELECT * FROM samples WHERE filePath=?', (filePath, ))
+            self.sampleDb.execute('SELECT rowid FROM samples WHERE filePath=?', (filePath, ))
             if not self.sampleDb.fetchone():
                 new.append(fileIndex)
             else:
@@ -763,13 +808,11 @@ class SampleBrowse(QtWidgets.QMainWindow):
         res = menu.exec_(self.sampleView.viewport().mapToGlobal(pos))
         if res == addAllAction:
             self.addSampleGroupToDb(new)
-            self.dbDirModel.updateTree()
             [utils.setBold(fileIndex, True) for fileIndex in new]
         elif res == addAllWithTagsAction:
             tags = AddSamplesWithTagDialog(self, new).exec_()
             if isinstance(tags, str):
                 self.addSampleGroupToDb(new, tags)
-                self.dbDirModel.updateTree()
                 [utils.setBold(fileIndex, True) for fileIndex in new]
         elif res == editTagsAction:
             indexes = []
@@ -780,8 +823,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
                 fileList.append(filePath)
                 tagsIndex = fileIndex.sibling(fileIndex.row(), tagsColumn)
                 indexes.append(tagsIndex)
-                self.sampleDb.execute('SELECT tags FROM samples WHERE filePath=?', (filePath, ))
-                tagList = list(filter(None, self.sampleDb.fetchone()[0].split(',')))
+                tagList = self.sampleDb.sampleTags(filePath)
                 if tagList:
                     tags.add(tuple(tagList))
             uncommon = False
@@ -795,15 +837,18 @@ class SampleBrowse(QtWidgets.QMainWindow):
             res = TagsEditorDialog(self, tags, uncommon=uncommon).exec_()
             if not isinstance(res, list):
                 return
+            tagDelta = TagDelta()
             for filePath, index in zip(fileList, indexes):
-                self.sampleView.model().setData(index, res, TagsRole)
-                self.sampleDb.execute('UPDATE samples SET tags=? WHERE filePath=?', (','.join(res), filePath))
-            self.reloadTags()
+                self.sampleView.model().setData(index, self.setSampleTags(filePath, res, tagDelta), TagsRole)
             self.sampleDb.commit()
+            self.applyTagDelta(tagDelta)
             self.statusBar.addMessage(StatusSamplesTagsEdited, len(fileList))
         elif res == removeAllAction:
             if RemoveSamplesDialog(self, exist).exec_():
                 fileNames = [i.data(FilePathRole) for i in exist]
+                tagDelta = TagDelta()
+                for filePath in fileNames:
+                    tagDelta.update(self.sampleDb.sampleTags(filePath), None)
                 if len(fileNames) < 999:
                     self.sampleDb.execute(
                         'DELETE FROM samples WHERE filePath IN ({})'.format(','.join(['?' for i in fileNames])), 
@@ -817,24 +862,119 @@ class SampleBrowse(QtWidgets.QMainWindow):
                             )
                 self.sampleDb.commit()
                 if self.sampleView.model() == self.dbProxyModel:
-                    for index in sorted(exist, key=lambda index: index.row(), reverse=True):
-                        self.dbModel.takeRow(index.row())
+                    for row in sorted((self.dbProxyModel.mapToSource(index).row() for index in exist), reverse=True):
+                        self.dbModel.removeRow(row)
                 else:
                     [utils.setBold(fileIndex, False) for fileIndex in exist]
                     self.sampleDbUpdated = True
-                self.reloadTags()
-                self.dbDirModel.updateTree()
+                self.applyTagDelta(tagDelta)
+                self.dbDirModel.removePaths(fileNames)
                 self.statusBar.addMessage(StatusSamplesRemoved, len(fileNames))
 
+    def removeMissingSamples(self, filePaths):
+        if QtWidgets.QMessageBox.question(
+            self, 
+            'Remove missing samples?', 
+            '{} sample{} in the database no longer exist{} on disk.\nRemove {} from database?'.format(
+                len(filePaths), 
+                's' if len(filePaths) > 1 else '', 
+                '' if len(filePaths) > 1 else 's', 
+                'them' if len(filePaths) > 1 else 'it', 
+                )
+            ) != QtWidgets.QMessageBox.Yes:
+                return
+        self.removeSamplesFromDb(filePaths)
+        self.statusBar.addMessage(StatusSamplesRemoved, len(filePaths))
+
+    def removeSamplesFromDb(self, filePaths):
+        tagDelta = TagDelta()
+        for filePath in filePaths:
+            tagDelta.update(self.sampleDb.sampleTags(filePath), None)
+        for items in [filePaths[i:i+999] for i in range(0, len(filePaths), 999)]:
+            self.sampleDb.execute(
+                'DELETE FROM samples WHERE filePath IN ({})'.format(','.join(['?' for i in items])), 
+                items
+                )
+        self.sampleDb.commit()
+        rows = [self.dbModel.rowForPath(filePath) for filePath in filePaths]
+        for row in sorted((row for row in rows if row >= 0), reverse=True):
+            self.dbModel.removeRow(row)
+        self.applyTagDelta(tagDelta)
+        self.dbDirModel.removePaths(filePaths)
+
+    def setDbWatch(self):
+        enabled = self.settings.value('dbWatch', False, type=bool)
+        polling = self.settings.value('dbWatchPolling', False, type=bool)
+        if self.dbWatcher is not None:
+            if enabled and self.dbWatcher.polling == polling:
+                return
+            self.dbWatcher.close()
+            self.dbWatcher.deleteLater()
+            self.dbWatcher = None
+        if enabled:
+            self.dbWatcher = DbWatcher(self.sampleDb, polling, self)
+            self.dbWatcher.changed.connect(self.applyWatchChanges)
+            self.updateWatchedDirs()
+
+    def updateWatchedDirs(self):
+        if self.dbWatcher is not None:
+            self.dbWatcher.setDirs(self.dbDirModel.dirPaths())
+
+    def applyWatchChanges(self, changes):
+        tagDelta = TagDelta()
+        newPaths = []
+        for filePath, fileName, info, fingerprint in changes.created:
+            if self._addSampleToDb(filePath, fileName, info, '', tagDelta=tagDelta):
+                newPaths.append(filePath)
+        self.updateSampleFiles(changes.modified)
+        for filePath, newPath, fingerprint in changes.moved:
+            self.sampleDb.moveSample(filePath, newPath, fingerprint)
+        self.sampleDb.commit()
+        if changes.deleted:
+            self.removeSamplesFromDb(changes.deleted)
+        self.dbModel.updateSamples([(filePath, filePath, info) for filePath, info, fingerprint in changes.modified if info is not None] + 
+            [(filePath, newPath, None) for filePath, newPath, fingerprint in changes.moved])
+        self.applyTagDelta(tagDelta)
+        if changes.moved:
+            self.dbDirModel.removePaths([filePath for filePath, newPath, fingerprint in changes.moved])
+            newPaths.extend(newPath for filePath, newPath, fingerprint in changes.moved)
+        if newPaths:
+            self.dbDirModel.addPaths(newPaths)
+        if changes.created:
+            self.sampleDbUpdated = True
+        self.buildPreviews([filePath for filePath, fileName, info, fingerprint in changes.created] + 
+            [filePath for filePath, info, fingerprint in changes.modified if info is not None])
+        self.statusBar.addMessage(StatusDbSynced, 
+            len(changes.created) + len(changes.modified) + len(changes.moved) + len(changes.deleted))
+
+    def updateSampleFiles(self, samples):
+        #samples are updated in place, keeping their rowid and tags
+        for filePath, info, fingerprint in samples:
+            if info is None:
+                self.sampleDb.updateSampleFile(filePath, fingerprint)
+            else:
+                self.sampleDb.updateSampleFile(filePath, fingerprint, float(info.frames) / info.samplerate, 
+                    info.format, info.samplerate, info.channels, info.subtype)
+
+    def applyChangedSamples(self, samples):
+        self.updateSampleFiles(samples)
+        self.sampleDb.commit()
+        self.dbModel.updateSamples([(filePath, filePath, info) for filePath, info, fingerprint in samples if info is not None])
+        self.buildPreviews([filePath for filePath, info, fingerprint in samples if info is not None])
+
     def addSampleGroupToDb(self, fileIndexes, tags=''):
+        newPaths = []
+        tagDelta = TagDelta()
         for fileIndex in fileIndexes:
             filePath = fileIndex.data(FilePathRole)
             fileName = fileIndex.data()
             info = fileIndex.data(InfoRole)
-            self._addSampleToDb(filePath, fileName, info, tags)
+            if self._addSampleToDb(filePath, fileName, info, tags, tagDelta=tagDelta):
+                newPaths.append(filePath)
         self.sampleDb.commit()
-        self.reloadTags()
-        self.dbDirModel.updateTree()
+        self.buildPreviews([fileIndex.data(FilePathRole) for fileIndex in fileIndexes])
+        self.applyTagDelta(tagDelta)
+        self.dbDirModel.addPaths(newPaths)
         self.statusBar.addMessage(StatusSamplesAdded, len(fileIndexes))
 #        if self.sampleView.model() == self.browseModel:
 #            self.sampleDbUpdated = True
@@ -842,27 +982,57 @@ class SampleBrowse(QtWidgets.QMainWindow):
 #            reload query
 
     def addSampleToDb(self, filePath, fileName=None, info=None, tags='', preview=None):
-        self._addSampleToDb(filePath, fileName, info, tags, preview)
+        tagDelta = TagDelta()
+        new = self._addSampleToDb(filePath, fileName, info, tags, preview, tagDelta)
         self.sampleDb.commit()
-        self.reloadTags()
+        if preview is None:
+            self.buildPreviews([filePath])
+        self.applyTagDelta(tagDelta)
         if self.sampleView.model() == self.browseModel:
             self.sampleDbUpdated = True
-        self.dbDirModel.updateTree()
+        if new:
+            self.dbDirModel.addPaths([filePath])
 #        else:
 #            reload query
 
-    def _addSampleToDb(self, filePath, fileName=None, info=None, tags='', preview=None):
+    def _addSampleToDb(self, filePath, fileName=None, info=None, tags='', preview=None, tagDelta=None):
         if not fileName:
             fileName = QtCore.QFile(filePath).fileName()
         if not info:
             try:
-                soundfile.info(filePath)
+                info = sampleInfo(filePath)
             except:
                 return
-        self.sampleDb.execute(
-            'INSERT OR REPLACE INTO samples values (?,?,?,?,?,?,?,?,?)', 
-            (filePath, fileName, float(info.frames) / info.samplerate, info.format, info.samplerate, info.channels, info.subtype, tags, preview), 
-            )
+        oldTags, newTags = self.sampleDb.addSample(filePath, fileName, float(info.frames) / info.samplerate, info.format, info.samplerate, info.channels, info.subtype, tags, preview, fileFingerprint(filePath))
+        if tagDelta is not None:
+            tagDelta.update(oldTags, newTags)
+        #True if the sample was not in the database yet
+        return oldTags is None
+
+    def setSampleTags(self, filePath, tags, tagDelta):
+        oldTags = self.sampleDb.sampleTags(filePath)
+        newTags = self.sampleDb.setSampleTags(filePath, tags)
+        if newTags is not None:
+            tagDelta.update(oldTags, newTags)
+        return newTags
+
+    def applyTagDelta(self, tagDelta):
+        #only the changed tags and their parents are updated
+        self.dbTreeModel.applyDelta(tagDelta)
+        self.dbTreeView.resizeColumnToContents(1)
+
+    def buildPreviews(self, filePaths):
+        #previews are computed in the background and stored as they are ready
+        if not filePaths:
+            return
+        builder = PreviewBuilder(filePaths, self.player.sampleRate, self.player.sampleRateConversion, self.previewStop, self.peakCache)
+        builder.signals.built.connect(self.previewsBuilt)
+        self.previewPool.start(builder)
+
+    def previewsBuilt(self, previews):
+        for filePath, preview in previews:
+            self.sampleDb.execute('UPDATE samples SET preview=? WHERE filePath=?', (sqlite3.Binary(preview), filePath))
+        self.sampleDb.commit()
 
     def browseDb(self, query=None, refresh=True):
         if query is None:
@@ -871,41 +1041,33 @@ class SampleBrowse(QtWidgets.QMainWindow):
                     self.sampleView.setCurrentIndex(self.currentShownSampleIndex)
                 return
             elif not self.currentDbQuery:
-                query = 'SELECT * FROM samples', tuple()
+                query = '', tuple()
             else:
                 query = self.currentDbQuery
         self.currentDbQuery = query
         self.sampleDbUpdated = False
-        self.dbModel.clear()
-        self.dbModel.setHorizontalHeaderLabels(['Name', 'Path', 'Length', 'Format', 'Rate', 'Ch.', 'Bits', 'Tags', 'Preview'])
+        self.dbModel.setQuery(*query)
         for column, visible in dbViewColumns.items():
             self.sampleView.horizontalHeader().setSectionHidden(column, not visible)
-        for row in self.sampleDb.execute(*query):
-            filePath, fileName, length, format, sampleRate, channels, subtype, tags, data = row
-            fileItem = QtGui.QStandardItem(fileName)
-            fileItem.setData(filePath, FilePathRole)
-            dirItem = QtGui.QStandardItem(QtCore.QDir.toNativeSeparators(QtCore.QFileInfo(filePath).absolutePath()))
-            fileItem.setIcon(QtGui.QIcon.fromTheme('media-playback-start'))
-            lengthItem = QtGui.QStandardItem(timeStr(length, trailingAlways=True))
-            lengthItem.setData(length, DataRole)
-            formatItem = QtGui.QStandardItem(format)
-            formatItem.setData(format, DataRole)
-            rateItem = QtGui.QStandardItem(str(sampleRate))
-            rateItem.setData(sampleRate, DataRole)
-            channelsItem = QtGui.QStandardItem(str(channels))
-            channelsItem.setData(channels, DataRole)
-            subtypeItem = QtGui.QStandardItem(subtype)
-            subtypeItem.setData(subtype, DataRole)
-            tagsItem = QtGui.QStandardItem()
-            tagsItem.setData(list(filter(None, tags.split(','))), TagsRole)
-#            self.dbModel.appendRow([fileItem, lengthItem, formatItem, rateItem, channelsItem, tagsItem])
-            self.dbModel.appendRow([fileItem, dirItem, lengthItem, formatItem, rateItem, channelsItem, subtypeItem, tagsItem])
+        #column widths are computed on the visible rows only; rows have all
+        #the same height, so the first one is enough to set it
         self.sampleView.resizeColumnsToContents()
         self.sampleView.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
         self.sampleView.horizontalHeader().setSectionResizeMode(1, QtWidgets.QHeaderView.Stretch)
         for c in range(2, subtypeColumn + 1):
             self.sampleView.horizontalHeader().setSectionResizeMode(c, QtWidgets.QHeaderView.Fixed)
-        self.sampleView.resizeRowsToContents()
+        if self.dbModel.rowCount():
+            self.sampleView.verticalHeader().setDefaultSectionSize(self.sampleView.sizeHintForRow(0))
+
+    def dbFiltersChanged(self, filterData):
+        if self.dbModel.complete and not self.dbModel.filter[0] and self.dbModel.pending is None:
+            #the whole result is already loaded, filter it in memory
+            self.dbProxyModel.setFilterData(filterData)
+        else:
+            #only the matching samples are read from the database, the
+            #first page in the background
+            self.dbProxyModel.setFilterData([])
+            self.dbModel.setFilter(*self.sampleDb.filterCondition(filterData))
 
     def sampleViewDoubleClicked(self, index):
         if not self.player.isActive() and index.column() not in (0, tagsColumn):
@@ -916,15 +1078,14 @@ class SampleBrowse(QtWidgets.QMainWindow):
             return
         fileIndex = index.sibling(index.row(), 0)
         filePath = fileIndex.data(FilePathRole)
-        self.sampleDb.execute('SELECT tags FROM samples WHERE filePath=?', (filePath, ))
-        tags = list(filter(None, self.sampleDb.fetchone()[0].split(',')))
+        tags = self.sampleDb.sampleTags(filePath)
         res = TagsEditorDialog(self, tags, fileIndex.data()).exec_()
         if not isinstance(res, list):
             return
-        self.sampleView.model().setData(index, res, TagsRole)
-        self.sampleDb.execute('UPDATE samples SET tags=? WHERE filePath=?', (','.join(res), filePath))
+        tagDelta = TagDelta()
+        self.sampleView.model().setData(index, self.setSampleTags(filePath, res, tagDelta), TagsRole)
         self.sampleDb.commit()
-        self.reloadTags()
+        self.applyTagDelta(tagDelta)
         self.sampleView.resizeColumnToContents(tagsColumn)
 
     def saveTagColors(self, index, foregroundColor, backgroundColor):
@@ -962,25 +1123,12 @@ class SampleBrowse(QtWidgets.QMainWindow):
             return
         newTag = '/'.join(newTagTree[:depth])
         oldTag = '/'.join(oldTagTree[:depth])
-        self.sampleDb.execute('SELECT filePath,tags FROM samples WHERE tags LIKE ?', ('%{}%'.format(oldTag), ))
-        for filePath, tags in self.sampleDb.fetchall():
-            tags = tags.split(',')
-            newTags = set()
-            for tag in tags:
-                if tag == oldTag:
-                    newTags.add(newTag)
-                elif tag.startswith('{}/'.format(oldTag)):
-                    newTags.add('{}/{}'.format(newTag, tag[len(oldTag):]))
-                else:
-                    newTags.add(tag)
-            self.sampleDb.execute('UPDATE samples SET tags=? WHERE filePath=?', (','.join(sorted(newTags)), filePath))
-            self.sampleDb.commit()
-            sampleMatch = self.dbModel.match(self.dbModel.index(0, 0), FilePathRole, filePath, flags=QtCore.Qt.MatchExactly)
-            if not sampleMatch:
-                continue
-            fileIndex = sampleMatch[0]
-            tagsIndex = fileIndex.sibling(fileIndex.row(), tagsColumn)
-            self.dbModel.setData(tagsIndex, sorted(newTags), TagsRole)
+        changed = self.sampleDb.renameTag(oldTag, newTag)
+        self.sampleDb.commit()
+        for filePath, tags in changed:
+            tagsIndex = self.dbModel.indexFromPath(filePath, tagsColumn)
+            if tagsIndex.isValid():
+                self.dbModel.setData(tagsIndex, tags, TagsRole)
         self.statusBar.addMessage(StatusTagRenamed, newTag, oldTag)
 
     def renameTag(self, index):
@@ -995,33 +1143,19 @@ class SampleBrowse(QtWidgets.QMainWindow):
     def removeTag(self, index):
         index = self.dbTreeProxyModel.mapToSource(index)
         currentTag = self.dbTreeModel.pathFromIndex(index)
-        self.sampleDb.execute('SELECT filePath, tags FROM samples WHERE tags LIKE ?', ('%{}%'.format(currentTag), ))
-        files = []
-        for filePath, tags in self.sampleDb.fetchall():
-            tags = set(filter(None, tags.split(',')))
-            if currentTag in tags:
-                files.append((filePath, tags ^ set((currentTag, ))))
-            else:
-                for tag in tags:
-                    if tag.startswith(currentTag):
-                        files.append((filePath, tags ^ set((currentTag, ))))
-                        break
+        fileCount = self.sampleDb.tagCount(currentTag)
         if QtWidgets.QMessageBox.question(
             self, 
             'Remove tag?', 
             'Remove tag "{tag}" {children}from database?{hasFiles}'.format(
                 tag=currentTag, 
                 children='and its children ' if self.dbTreeModel.hasChildren(index) else '', 
-                hasFiles='\nThis action applies to {} files in database (they will not be removed).'.format(len(files)) if files else '', 
+                hasFiles='\nThis action applies to {} files in database (they will not be removed).'.format(fileCount) if fileCount else '', 
                 )
             ) == QtWidgets.QMessageBox.Yes:
-                for filePath, tags in files:
-                    tags = sorted(tags)
-                    self.sampleDb.execute('UPDATE samples SET tags=? WHERE filePath=?', (','.join(tags), filePath))
-                    match = self.dbModel.match(self.dbModel.index(0, 0), FilePathRole, filePath, flags=QtCore.Qt.MatchExactly)
-                    if match:
-                        fileIndex = match[0]
-                        tagsIndex = fileIndex.sibling(fileIndex.row(), tagsColumn)
+                for filePath, tags in self.sampleDb.removeTag(currentTag):
+                    tagsIndex = self.dbModel.indexFromPath(filePath, tagsColumn)
+                    if tagsIndex.isValid():
                         self.dbModel.setData(tagsIndex, tags, TagsRole)
                 self.sampleDb.execute(
                     'DELETE FROM tagColors WHERE tag=?', 
@@ -1036,12 +1170,7 @@ class SampleBrowse(QtWidgets.QMainWindow):
                 self.statusBar.addMessage(StatusTagRemoved, currentTag)
 
     def reloadTags(self):
-        self.sampleDb.execute('SELECT tags FROM samples')
-        tags = set()
-        for tagList in self.sampleDb.fetchall():
-            tagList = tagList[0].strip(',').split(',')
-            [tags.add(tag.strip().strip('\n')) for tag in tagList]
-        self.dbTreeModel.setTags(tags)
+        self.dbTreeModel.setTags()
         self.dbTreeView.sortByColumn(0, QtCore.Qt.AscendingOrder)
         self.dbTreeView.resizeColumnToContents(1)
         self.dbTreeView.header().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
@@ -1053,12 +1182,6 @@ class SampleBrowse(QtWidgets.QMainWindow):
             self.currentDbQuery = None
             self.browseDb(refresh=True)
             return
-        #TODO this has to be implemented along with browseDb
-        self.dbModel.clear()
-        self.dbModel.setHorizontalHeaderLabels(['Name', 'Path', 'Length', 'Format', 'Rate', 'Ch.', 'Bits', 'Tags', 'Preview'])
-        for column, visible in dbViewColumns.items():
-            self.sampleView.horizontalHeader().setSectionHidden(column, not visible)
-
         currentTag = index.data()
         current = index
         #TODO: use indexFromPath?
@@ -1068,70 +1191,42 @@ class SampleBrowse(QtWidgets.QMainWindow):
                 break
             currentTag = '{parent}/{current}'.format(parent=parent.data(), current=currentTag)
             current = parent
-        hasChildren = self.dbTreeProxyModel.hasChildren(index)
-        self.sampleDb.execute('SELECT * FROM samples WHERE tags LIKE ?', ('%{}%'.format(currentTag), ))
-        for row in self.sampleDb.fetchall():
-            filePath, fileName, length, format, sampleRate, channels, subtype, tags, data = row
-            if hasChildren:
-                for tag in tags.split(','):
-                    if tag.startswith(currentTag):
-                        break
-                else:
-                    continue
-            elif not currentTag in tags:
-                continue
-            fileItem = QtGui.QStandardItem(fileName)
-            fileItem.setData(filePath, FilePathRole)
-            fileItem.setIcon(QtGui.QIcon.fromTheme('media-playback-start'))
-            dirItem = QtGui.QStandardItem(QtCore.QDir.toNativeSeparators(QtCore.QFileInfo(filePath).absolutePath()))
-            lengthItem = QtGui.QStandardItem(timeStr(length, trailingAlways=True))
-            lengthItem.setData(length, DataRole)
-            formatItem = QtGui.QStandardItem(format)
-            formatItem.setData(format, DataRole)
-            rateItem = QtGui.QStandardItem(str(sampleRate))
-            rateItem.setData(sampleRate, DataRole)
-            channelsItem = QtGui.QStandardItem(str(channels))
-            channelsItem.setData(channels, DataRole)
-            subtypeItem = QtGui.QStandardItem(subtype)
-            subtypeItem.setData(subtype, DataRole)
-            tagsItem = QtGui.QStandardItem()
-            tagsItem.setData(list(filter(None, tags.split(','))), TagsRole)
-            self.dbModel.appendRow([fileItem, dirItem, lengthItem, formatItem, rateItem, channelsItem, subtypeItem, tagsItem])
-        self.sampleView.resizeColumnsToContents()
-        self.sampleView.horizontalHeader().setSectionResizeMode(0, QtWidgets.QHeaderView.Stretch)
-        self.sampleView.horizontalHeader().setSectionResizeMode(1, QtWidgets.QHeaderView.Stretch)
-        for c in range(2, subtypeColumn + 1):
-            self.sampleView.horizontalHeader().setSectionResizeMode(c, QtWidgets.QHeaderView.Fixed)
-        self.sampleView.resizeRowsToContents()
+        self.browseDb(self.sampleDb.tagCondition(currentTag))
 
     def dbDirViewSelect(self, index):
         if index.column() != 0:
             index = index.sibling(index.row(), 0)
-        self.browseDb(('SELECT * from samples WHERE filePath LIKE ?', ('{}%'.format(index.data(FilePathRole)), )))
+        #range on the primary key, '0' is the character that follows '/'
+        path = index.data(FilePathRole).rstrip('/')
+        self.browseDb(('filePath>=? AND filePath<?', (path + '/', path + '0')))
 
     def addSamplesToTag(self, sampleList, newTag):
+        tagDelta = TagDelta()
         for filePath in sampleList:
-            self.sampleDb.execute('SELECT tags FROM samples WHERE filePath=?', (filePath, ))
-            tags = set(filter(None, self.sampleDb.fetchone()[0].split(',')))
-            tags.add(newTag)
-            self.sampleDb.execute('UPDATE samples SET tags=? WHERE filePath=?', (','.join(tags), filePath))
-            sampleMatch = self.dbModel.match(self.dbModel.index(0, 0), FilePathRole, filePath, flags=QtCore.Qt.MatchExactly)
-            if sampleMatch:
-                fileIndex = sampleMatch[0]
-                tagsIndex = fileIndex.sibling(fileIndex.row(), tagsColumn)
+            oldTags = self.sampleDb.sampleTags(filePath)
+            tags = self.sampleDb.addSampleTag(filePath, newTag)
+            if tags is None:
+                continue
+            tagDelta.update(oldTags, tags)
+            tagsIndex = self.dbModel.indexFromPath(filePath, tagsColumn)
+            if tagsIndex.isValid():
                 self.dbModel.setData(tagsIndex, tags, TagsRole)
         self.sampleView.viewport().update()
         self.sampleDb.commit()
-        self.reloadTags()
+        self.applyTagDelta(tagDelta)
 
     def importSamplesWithTags(self, sampleList, tagIndex):
+        newPaths = []
+        tagDelta = TagDelta()
         for filePath, fileName, info, tags in sampleList:
-            self._addSampleToDb(filePath, fileName, info, ','.join(tags))
+            if self._addSampleToDb(filePath, fileName, info, ','.join(tags), tagDelta=tagDelta):
+                newPaths.append(filePath)
         self.sampleDb.commit()
-        self.reloadTags()
+        self.buildPreviews([sample[0] for sample in sampleList])
+        self.applyTagDelta(tagDelta)
         if tagIndex.isValid():
             self.dbTreeViewDoubleClicked(tagIndex)
-        self.dbDirModel.updateTree()
+        self.dbDirModel.addPaths(newPaths)
 
 
     def toggleBrowser(self, index):
@@ -1179,20 +1274,71 @@ class SampleBrowse(QtWidgets.QMainWindow):
         self.player.stop()
         fileIndex = index.sibling(index.row(), 0)
         self.currentSampleIndex = fileIndex
-        #setCurrentWave also loads waveData
-        #might want to launch it in a separated thread or something else whenever a database will be added?
-        if not self.setCurrentWave(fileIndex):
+        #decoding is done by waveLoader, playback starts in waveLoaded
+        if not self.setCurrentWave(fileIndex, play=True):
             #file not available or not readable... do something!
             self.setIndexReadable(fileIndex, False)
             self.audioInfoTabWidget.clear()
             return
         self.setIndexReadable(fileIndex, True)
-        fileItem = self.sampleView.model().itemFromIndex(fileIndex)
+
+    def previewLoaded(self, filePath, preview, draw, play):
+        if draw and self.currentShownSampleIndex and self.currentShownSampleIndex.data(FilePathRole) == filePath:
+            self.waveView.drawWave(preview.peaks)
+        if play and self.currentSampleIndex and self.currentSampleIndex.data(FilePathRole) == filePath:
+            self.playPreview(self.currentSampleIndex, preview)
+
+    def peaksLoaded(self, filePath, peaks):
+        if self.currentShownSampleIndex and self.currentShownSampleIndex.data(FilePathRole) == filePath:
+            self.waveView.drawWave(peaks)
+
+    def waveLoaded(self, filePath, waveStream):
+        if not self.currentSampleIndex or self.currentSampleIndex.data(FilePathRole) != filePath:
+            return
+        fileIndex = self.currentSampleIndex
+        if self.previewPlaying == filePath and self.player.isActive():
+            #the preview is still playing, continue with the file contents
+            self.previewPlaying = None
+            self.player.switchStream(waveStream)
+        else:
+            self.previewPlaying = None
+            self.startPlayback(fileIndex, waveStream)
+        self.prefetchNeighbours(fileIndex)
+
+    def startPlayback(self, fileIndex, waveStream, waiting=False):
         info = fileIndex.data(InfoRole)
-        waveData = fileItem.data(WaveRole)
         self.waveView.resetPlayhead(info.samplerate)
-        self.player.play(waveData, info)
-        fileItem.setIcon(QtGui.QIcon.fromTheme('media-playback-stop'))
+        self.player.play(waveStream, info, waiting)
+        fileIndex.model().setData(fileIndex, QtGui.QIcon.fromTheme('media-playback-stop'), QtCore.Qt.DecorationRole)
+
+    def prefetchNeighbours(self, fileIndex):
+        #decode the rows around the playing one, nearest first, so that
+        #keyboard navigation finds them already in the audio cache
+        model = fileIndex.model()
+        rowCount = model.rowCount()
+        rows = []
+        for distance in range(1, max(self.prefetchNext, self.prefetchPrevious) + 1):
+            if distance <= self.prefetchNext:
+                rows.append((fileIndex.row() + distance) % rowCount)
+            if distance <= self.prefetchPrevious:
+                rows.append((fileIndex.row() - distance) % rowCount)
+        filePaths = []
+        for row in rows:
+            filePath = model.index(row, 0).data(FilePathRole)
+            if row != fileIndex.row() and filePath not in filePaths:
+                filePaths.append(filePath)
+        self.waveLoader.prefetch(filePaths)
+
+    def waveLoadFailed(self, filePath):
+        for index in (self.currentShownSampleIndex, self.currentSampleIndex):
+            if index and index.data(FilePathRole) == filePath:
+                self.setIndexReadable(index, False)
+        if self.currentShownSampleIndex and self.currentShownSampleIndex.data(FilePathRole) == filePath:
+            self.waveView.clear()
+        if self.previewPlaying == filePath:
+            self.player.stop()
+        if self.currentSampleIndex and self.currentSampleIndex.data(FilePathRole) == filePath:
+            self.currentSampleIndex = None
 
     def movePlayhead(self):
 #        bytesInBuffer = self.player.output.bufferSize() - self.player.output.bytesFree()
@@ -1202,19 +1348,12 @@ class SampleBrowse(QtWidgets.QMainWindow):
 
     def stopped(self):
         self.waveScene.cursorPlayhead.hide()
+        self.previewPlaying = None
         if self.currentSampleIndex:
             model = self.currentSampleIndex.model()
-            model.itemFromIndex(self.currentSampleIndex).setData(QtGui.QIcon.fromTheme('media-playback-start'), QtCore.Qt.DecorationRole)
+            model.setData(self.currentSampleIndex, QtGui.QIcon.fromTheme('media-playback-start'), QtCore.Qt.DecorationRole)
             self.currentSampleIndex = None
 
-    def getWaveData(self, filePath):
-        try:
-            with soundfile.SoundFile(filePath) as sf:
-                waveData = sf.read(always_2d=True, dtype='float32')
-            return waveData
-        except:
-            return False
-
     def selectTagOnTree(self, tag):
         index = self.dbTreeModel.indexFromPath(tag)
         if index:
@@ -1225,38 +1364,39 @@ class SampleBrowse(QtWidgets.QMainWindow):
 
     def tagsApplied(self, tagList):
         filePath = self.currentShownSampleIndex.data(FilePathRole)
-        self.sampleDb.execute('SELECT * FROM samples WHERE filePath=?', (filePath, ))
-        if not self.sampleDb.fetchone():
+        tagDelta = TagDelta()
+        tagList = self.setSampleTags(filePath, tagList, tagDelta)
+        if tagList is None:
             return
-        self.sampleDb.execute('UPDATE samples SET tags=? WHERE filePath=?', (','.join(tagList), filePath))
         self.sampleDb.commit()
-        self.reloadTags()
-        sampleMatch = self.dbModel.match(self.dbModel.index(0, 0), FilePathRole, filePath, flags=QtCore.Qt.MatchExactly)
-        if sampleMatch:
-            fileIndex = sampleMatch[0]
-            tagsIndex = fileIndex.sibling(fileIndex.row(), tagsColumn)
-            self.dbModel.itemFromIndex(tagsIndex).setData(tagList, TagsRole)
+        self.applyTagDelta(tagDelta)
+        tagsIndex = self.dbModel.indexFromPath(filePath, tagsColumn)
+        if tagsIndex.isValid():
+            self.dbModel.setData(tagsIndex, tagList, TagsRole)
 
-    def setCurrentWave(self, index=None):
+    def setCurrentWave(self, index=None, play=False):
         if index is None:
             self.waveView.clear()
             self.audioInfoTabWidget.clear()
-        if self.currentShownSampleIndex and self.currentShownSampleIndex == index:
-            return True
         fileIndex = index.sibling(index.row(), 0)
-        if self.player.isActive() and self.currentSampleIndex and self.currentSampleIndex != fileIndex:
+        filePath = fileIndex.data(FilePathRole)
+        if self.currentShownSampleIndex and self.currentShownSampleIndex == fileIndex:
+            if play:
+                self.waveLoader.load(filePath, draw=False, play=True, previewDb=self.previewDb())
+            return True
+        if self.currentSampleIndex and self.currentSampleIndex != fileIndex:
             self.play(fileIndex)
+            return True
 #            self.player.stop()
         info = fileIndex.data(InfoRole)
         if not info:
-            fileItem = self.sampleView.model().itemFromIndex(fileIndex)
             try:
-                info = soundfile.info(fileItem.data(FilePathRole))
-                fileItem.setData(info, InfoRole)
+                info = sampleInfo(filePath)
+                self.sampleView.model().setData(fileIndex, info, InfoRole)
             except:
                 self.waveView.clear()
                 self.audioInfoTabWidget.clear()
-                utils.setItalic(fileItem)
+                utils.setItalic(fileIndex)
                 return False
         if self.sampleView.model() == self.dbProxyModel:
             tags = []
@@ -1269,19 +1409,29 @@ class SampleBrowse(QtWidgets.QMainWindow):
 
         self.currentShownSampleIndex = fileIndex
 
-        self.drawWave(fileIndex)
+        self.drawWave(fileIndex, play)
 
         return True
 
-    def drawWave(self, fileIndex):
-        waveData = fileIndex.data(WaveRole)
-        if waveData is None:
-            fileItem = self.sampleView.model().itemFromIndex(fileIndex)
-            waveData = self.getWaveData(fileItem.data(FilePathRole))
-            if not len(waveData):
-                return False
-            fileItem.setData(waveData, WaveRole)
-        self.waveView.drawWave(waveData)
+    def previewDb(self):
+        #database previews allow to draw and play before reading the file
+        if self.sampleView.model() == self.dbProxyModel:
+            return self.sampleDb.dbFile.absoluteFilePath()
+
+    def playPreview(self, fileIndex, preview):
+        if not preview or preview.audioRate != self.player.sampleRate or not len(preview.audio):
+            return
+        #the output waits at the end of the preview for the file contents,
+        #which continue it in waveLoaded
+        self.startPlayback(fileIndex, preview.stream(), waiting=True)
+        self.previewPlaying = fileIndex.data(FilePathRole)
+
+    def drawWave(self, fileIndex, play=False):
+        #decoding and peak computation are done in the background, any
+        #previous request still running is cancelled; previews are shown
+        #in the meantime
+        self.waveView.clear()
+        self.waveLoader.load(fileIndex.data(FilePathRole), play=play, previewDb=self.previewDb())
 
     def resizeEvent(self, event):
         self.waveView.fitInView(self.waveScene.waveRect)
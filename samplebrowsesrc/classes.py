@@ -1,72 +1,259 @@
 import sys
+import re
+import sqlite3
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from threading import Event
+import numpy as np
 import soundfile
 from PyQt5 import QtCore, QtGui
 from samplebrowsesrc.constants import *
+from samplebrowsesrc.utils import timeStr, fileFingerprint
+from samplebrowsesrc.probe import sampleInfo
+from samplebrowsesrc.sampledb import queryPage
+
+#rows read from the database at once by SampleTableModel
+samplePageSize = 2000
+#files probed at the same time by the Crawler; headers are small, reads
+#are mostly waiting for the disk
+defaultScanThreads = 8
+#files found but not probed yet, for each scan thread
+scanQueueSize = 64
+#seconds between Crawler progress reports
+scanProgressInterval = .5
+#samples found are emitted together, once there are enough or enough time
+#has passed since the previous group
+foundBatchSize = 500
+foundBatchInterval = .1
+
+
+class DirNode(object):
+    '''
+    Directory trie node; count is the number of samples in the directory and
+    its subdirectories, item the model row showing it, which is shared by all
+    the nodes of a collapsed chain.
+    '''
+    __slots__ = ('name', 'parent', 'children', 'count', 'item')
+    def __init__(self, name, parent=None):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.count = 0
+        self.item = None
+
+    def isChain(self):
+        #single subdirectories down to a leaf are shown in one row
+        node = self
+        while node.children:
+            if len(node.children) > 1:
+                return False
+            node = next(iter(node.children.values()))
+        return True
+
+    def path(self):
+        names = []
+        node = self
+        while node.parent is not None:
+            names.append(node.name)
+            node = node.parent
+        return '/'.join(reversed(names))
 
 
 class DbDirModel(QtGui.QStandardItemModel):
+    '''
+    Directory tree of the database samples, rendered from a path trie;
+    addPaths and removePaths only rebuild the rows of the directories whose
+    structure changed, the others just get their count updated.
+    '''
     loaded = QtCore.pyqtSignal()
     def __init__(self, db, *args, **kwargs):
         QtGui.QStandardItemModel.__init__(self, *args, **kwargs)
         self.db = db
-#        self.updateTree()
-#        self.rootItem = QtGui.QStandardItem('/')
-#        self.appendRow(self.rootItem)
+        self.root = '/' if sys.platform != 'win32' else ''
+        self.rootNode = DirNode('')
+
+    def dirTree(self, filePath):
+        return tuple(filter(None, filePath.rpartition('/')[0].split('/')))
 
     def updateTree(self):
+        self.clear()
+        self.rootNode = DirNode('')
         self.db.execute('SELECT filePath FROM samples')
-        root = '/' if sys.platform != 'win32' else ''
         for data in self.db.fetchall():
-            filePath = data[0]
-            fileInfo = QtCore.QFileInfo(filePath)
-            qdir = fileInfo.absoluteDir()
-            dirTree = tuple(filter(None, qdir.absolutePath().split('/')))
-            depth = 0
-            parentIndex = QtCore.QModelIndex()
-            sep = QtCore.QDir.separator()
-            while depth < len(dirTree):
-                subdir = '{}'.format(dirTree[depth])
-                if depth == 0:
-                    subdir = '{root}{subdir}'.format(root=root, subdir=subdir)
-                dirMatch = self.match(self.index(0, 0, parentIndex), DirNameRole, subdir, flags=QtCore.Qt.MatchExactly)
-                if not dirMatch:
-                    childItem = QtGui.QStandardItem('{subdir}{sep}'.format(subdir=subdir, sep=sep))
-                    childItem.setData(subdir, DirNameRole)
-                    childItem.setData('{root}{dirTree}'.format(root=root, dirTree='/'.join(dirTree[:depth + 1])), FilePathRole)
-                    countItem = QtGui.QStandardItem('1')
-                    try:
-                        self.itemFromIndex(parentIndex).appendRow([childItem, countItem])
-                    except:
-                        self.appendRow([childItem, countItem])
-                    parentIndex = childItem.index()
-                    depth += 1
+            node = self.rootNode
+            node.count += 1
+            for subdir in self.dirTree(data[0]):
+                try:
+                    node = node.children[subdir]
+                except KeyError:
+                    child = DirNode(subdir, node)
+                    node.children[subdir] = child
+                    node = child
+                node.count += 1
+        for node in self.rootNode.children.values():
+            self.renderNode(node)
+        self.loaded.emit()
+
+    def addPaths(self, filePaths):
+        for filePath in filePaths:
+            node = self.rootNode
+            node.count += 1
+            newNode = None
+            for subdir in self.dirTree(filePath):
+                try:
+                    node = node.children[subdir]
+                except KeyError:
+                    child = DirNode(subdir, node)
+                    node.children[subdir] = child
+                    if newNode is None:
+                        newNode = child
+                    node = child
+                node.count += 1
+            if newNode is None:
+                continue
+            parent = newNode.parent
+            if parent is self.rootNode:
+                self.renderNode(newNode)
+            elif len(parent.children) == 1 or parent.parent.item is parent.item or \
+                any(child.item is parent.item for child in parent.children.values()):
+                    #the parent was a leaf or part of a collapsed chain
+                    self.rerenderNode(self.chainHead(parent))
+            else:
+                self.renderNode(newNode)
+        self.updateCounts(filePaths)
+
+    def removePaths(self, filePaths):
+        for filePath in filePaths:
+            nodes = []
+            node = self.rootNode
+            for subdir in self.dirTree(filePath):
+                node = node.children.get(subdir)
+                if node is None:
+                    break
+                nodes.append(node)
+            else:
+                self.rootNode.count -= 1
+                removed = None
+                for node in nodes:
+                    node.count -= 1
+                    if not node.count and removed is None:
+                        removed = node
+                if removed is None:
+                    continue
+                parent = removed.parent
+                del parent.children[removed.name]
+                if parent is not self.rootNode and parent.isChain():
+                    self.rerenderNode(self.chainHead(parent))
+                else:
+                    self.takeItemRow(removed.item)
+        self.updateCounts(filePaths)
+
+    def dirPaths(self):
+        '''
+        Return a dict of the directories containing samples and their root,
+        the deepest directory including all the samples of a top level row.
+        '''
+        dirs = {}
+        for node in self.rootNode.children.values():
+            while len(node.children) == 1 and next(iter(node.children.values())).count == node.count:
+                node = next(iter(node.children.values()))
+            rootPath = '{root}{path}'.format(root=self.root, path=node.path())
+            nodes = [node]
+            while nodes:
+                node = nodes.pop()
+                dirs['{root}{path}'.format(root=self.root, path=node.path())] = rootPath
+                nodes.extend(node.children.values())
+        return dirs
+
+    def chainHead(self, node):
+        #topmost directory collapsed in the same row of node
+        while node.parent is not self.rootNode and len(node.parent.children) == 1:
+            node = node.parent
+        return node
+
+    def renderNode(self, node, row=None):
+        sep = QtCore.QDir.separator()
+        chain = [node]
+        if node.isChain():
+            while chain[-1].children:
+                chain.append(next(iter(chain[-1].children.values())))
+        dirName = node.name
+        if node.parent is self.rootNode:
+            dirName = '{root}{subdir}'.format(root=self.root, subdir=dirName)
+        item = QtGui.QStandardItem('{}{}'.format(dirName, sep) + ''.join('{}{}'.format(child.name, sep) for child in chain[1:]))
+        item.setData(dirName, DirNameRole)
+        item.setData('{root}{path}'.format(root=self.root, path=chain[-1].path()), FilePathRole)
+        countItem = QtGui.QStandardItem('{}'.format(node.count))
+        for child in chain:
+            child.item = item
+        parentItem = node.parent.item if node.parent.item is not None else self.invisibleRootItem()
+        if row is None:
+            parentItem.appendRow([item, countItem])
+        else:
+            parentItem.insertRow(row, [item, countItem])
+        if len(chain) == 1:
+            for child in node.children.values():
+                self.renderNode(child)
+
+    def rerenderNode(self, node):
+        row = node.item.row()
+        self.takeItemRow(node.item)
+        self.renderNode(node, row)
+
+    def parentItem(self, item):
+        parent = item.parent()
+        return parent if parent is not None else self.invisibleRootItem()
+
+    def takeItemRow(self, item):
+        self.parentItem(item).removeRow(item.row())
+
+    def updateCounts(self, filePaths):
+        done = set()
+        for filePath in filePaths:
+            node = self.rootNode
+            for subdir in self.dirTree(filePath):
+                node = node.children.get(subdir)
+                if node is None:
+                    break
+                if node.item is node.parent.item or id(node) in done:
                     continue
-                parentIndex = dirMatch[0]
-                countIndex = parentIndex.sibling(parentIndex.row(), 1)
-                self.setData(countIndex, '{}'.format(int(countIndex.data()) + 1))
-                depth += 1
-        self.optimizeTree()
+                done.add(id(node))
+                item = node.item
+                self.parentItem(item).child(item.row(), 1).setText('{}'.format(node.count))
         self.loaded.emit()
 
 
-    def optimizeTree(self):
-        for row in range(self.rowCount()):
-            self.optimizeItemTree(self.item(row))
+class TagDelta(object):
+    '''
+    Accumulates tag changes of samples, to be applied to a TagsModel with
+    applyTagDelta; each path is listed once for every changed sample.
+    '''
+    def __init__(self):
+        self.added = []
+        self.removed = []
+        self.total = 0
+
+    @staticmethod
+    def prefixes(tags):
+        paths = set()
+        for tag in tags:
+            while tag:
+                paths.add(tag)
+                tag = tag.rpartition('/')[0]
+        return paths
+
+    def update(self, oldTags, newTags):
+        #None means that the sample has been added or removed
+        if oldTags is None:
+            self.total += 1
+        if newTags is None:
+            self.total -= 1
+        oldPaths = self.prefixes(oldTags or [])
+        newPaths = self.prefixes(newTags or [])
+        self.added.extend(newPaths - oldPaths)
+        self.removed.extend(oldPaths - newPaths)
 
-    def optimizeItemTree(self, parent):
-        if not parent.rowCount():
-            return True
-        if parent.rowCount() > 1:
-            for row in range(parent.rowCount()):
-                self.optimizeItemTree(parent.child(row))
-            return False
-        child = parent.child(0)
-        if self.optimizeItemTree(child):
-            parent.takeRow(0)
-            parent.setText('{parent}{sep}{child}'.format(parent=parent.data(DirNameRole), sep=QtCore.QDir.separator(), child=child.text()))
-            parent.setData(child.data(FilePathRole), FilePathRole)
-            return True
 
 class TagsModel(QtGui.QStandardItemModel):
     tagRenamed = QtCore.pyqtSignal(str, str)
@@ -100,93 +287,104 @@ class TagsModel(QtGui.QStandardItemModel):
             depth += 1
         return current
 
-    def setTags(self, tags):
+    def setTags(self, counts=None):
+        #counts of all paths are computed at once, the tree is then updated
+        #using a path/item map instead of searching each level
         self.dataChanged.disconnect(self.updateTags)
-        tags = set(tags)
-        try:
-            tags.remove('')
-        except:
-            pass
+        if counts is None:
+            counts = self.db.tagCounts()
         self.db.execute('SELECT COUNT(*) FROM samples')
         self.totalCountItem.setText(str(self.db.fetchall()[0][0]))
-        for tag in tags:
-            self.checkAndCreateTags(tag.split('/'), 0)
-        currentTags = self.tags & tags
-        #check for removed tags
-        for tag in self.tags ^ currentTags:
-            self.clearTag(tag.split('/'), 0)
-        self.tags = tags
+        items = self.tagItems()
+        for tag in sorted(counts):
+            item = items.get(tag)
+            if item is not None:
+                countItem = item.parent().child(item.row(), 1)
+                if countItem.text() != str(counts[tag]):
+                    countItem.setText(str(counts[tag]))
+                continue
+            parentTag = tag.rpartition('/')[0]
+            items[tag] = self.createTagItem(tag, items[parentTag] if parentTag else self.item(0, 0), counts[tag])
+        #remove tags without samples, children first
+        for tag in sorted(set(items) - set(counts), reverse=True):
+            item = items[tag]
+            item.parent().removeRow(item.row())
+        self.tags = set(counts)
         self.dataChanged.connect(self.updateTags)
 
-    def clearTag(self, tagTree, depth, parentItem=None):
-#        return
-        if parentItem is None:
-            parentItem = self.item(0, 0)
-            parentIndex = self.index(0, 0, self.index(0, 0))
-        else:
-            parentIndex = self.index(0, 0, parentItem.index())
-        childTag = tagTree[depth]
-        childItemMatch = self.match(parentIndex, QtCore.Qt.DisplayRole, childTag, flags=QtCore.Qt.MatchExactly)
-        if not childItemMatch:
-            print('maccheccazz')
-            return
-        childIndex = childItemMatch[0]
-        if depth + 1 == len(tagTree):
-            childCountItem = self.itemFromIndex(childIndex.sibling(childIndex.row(), 1))
-            subtract = int(childCountItem.text())
-            childCountItem.setText('0')
-            return subtract
-        else:
-            subtract = self.clearTag(tagTree, depth + 1, self.itemFromIndex(childIndex))
-            try:
-                countItem = self.itemFromIndex(childIndex.sibling(childIndex.row(), 1))
-#                row = parentIndex.parent().row() if parentItem != self else childIndex.row()
-#                countItem = self.itemFromIndex(parentIndex.parent().sibling(parentIndex.row(), 1))
-                print(countItem.text(), subtract)
-#                countItem.setText('{}'.format(int(countItem.text()) - subtract))
-            except Exception as e:
-                print(e)
-
-    def checkAndCreateTags(self, tagTree, depth, parentItem=None):
+    def createTagItem(self, tag, parentItem, count):
+        childItem = QtGui.QStandardItem(tag.rpartition('/')[2])
+        colors = self.db.tagColorsDict.get(tag)
+        if colors:
+            childItem.setData(colors[0], QtCore.Qt.ForegroundRole)
+            childItem.setData(colors[1], QtCore.Qt.BackgroundRole)
+        parentItem.appendRow([childItem, QtGui.QStandardItem(str(count))])
+        return childItem
+
+    def itemFromPath(self, tag):
+        #only the children of each level along the path are checked
+        item = self.item(0, 0)
+        for childTag in tag.split('/'):
+            for row in range(item.rowCount()):
+                if item.child(row).text() == childTag:
+                    item = item.child(row)
+                    break
+            else:
+                return None
+        return item
+
+    def applyTagDelta(self, added, removed, totalDelta=0):
+        '''
+        Update the counts of the given paths (and create or remove their
+        items) without reading the whole database; added and removed list
+        each path once for every sample that gained or lost it.
+        '''
+        self.dataChanged.disconnect(self.updateTags)
+        deltas = {}
+        for tag in added:
+            deltas[tag] = deltas.get(tag, 0) + 1
+        for tag in removed:
+            deltas[tag] = deltas.get(tag, 0) - 1
+        if totalDelta:
+            self.totalCountItem.setText(str(int(self.totalCountItem.text()) + totalDelta))
+        emptyItems = []
+        #parents are always sorted before their children
+        for tag in sorted(deltas):
+            if not deltas[tag]:
+                continue
+            item = self.itemFromPath(tag)
+            if item is None:
+                if deltas[tag] > 0:
+                    parentTag = tag.rpartition('/')[0]
+                    parentItem = self.itemFromPath(parentTag) if parentTag else self.item(0, 0)
+                    self.createTagItem(tag, parentItem, deltas[tag])
+                    self.tags.add(tag)
+                continue
+            countItem = item.parent().child(item.row(), 1)
+            count = int(countItem.text()) + deltas[tag]
+            if count > 0:
+                countItem.setText(str(count))
+            else:
+                emptyItems.append(tag)
+        for tag in reversed(emptyItems):
+            item = self.itemFromPath(tag)
+            item.parent().removeRow(item.row())
+            self.tags.discard(tag)
+        self.dataChanged.connect(self.updateTags)
+
+    def applyDelta(self, tagDelta):
+        self.applyTagDelta(tagDelta.added, tagDelta.removed, tagDelta.total)
+
+    def tagItems(self, parentItem=None, parentTag=''):
         if parentItem is None:
             parentItem = self.item(0, 0)
-            parentIndex = self.index(0, 0, self.index(0, 0))
-        else:
-            parentIndex = self.index(0, 0, parentItem.index())
-        childTag = tagTree[depth]
-        currentTree = '/'.join(tagTree[:depth+1])
-        hasChildren = True if len(tagTree) > depth + 1 else False
-        self.db.execute('SELECT * FROM samples WHERE tags LIKE ?', ('%{}%'.format(currentTree), ))
-        count = 0
-        for item in self.db.fetchall():
-            for tag in item[tagsColumn].split(','):
-                if hasChildren:
-                    if tag.startswith(currentTree + '/'):
-                        count += 1
-                        break
-                else:
-                    if tag == currentTree:
-                        count += 1
-                        break
-        count = str(count)
-        childItemMatch = self.match(parentIndex, QtCore.Qt.DisplayRole, childTag, flags=QtCore.Qt.MatchExactly)
-        if childItemMatch:
-            childIndex = childItemMatch[0]
-            childItem = self.itemFromIndex(childIndex)
-            self.itemFromIndex(childIndex.sibling(childIndex.row(), 1)).setText(count)
-        else:
-            childItem = QtGui.QStandardItem(childTag)
-            self.db.execute('SELECT foreground,background FROM tagColors WHERE tag=?', ('/'.join(tagTree[:depth+1]), ))
-            colors = self.db.fetchone()
-            if colors:
-                childItem.setData(QtGui.QColor(colors[0]), QtCore.Qt.ForegroundRole)
-                childItem.setData(QtGui.QColor(colors[1]), QtCore.Qt.BackgroundRole)
-
-            countItem = QtGui.QStandardItem(count)
-            parentItem.appendRow([childItem, countItem])
-#        if len(tagTree[depth:]) > 1:
-        if hasChildren:
-            self.checkAndCreateTags(tagTree, depth + 1, childItem)
+        items = {}
+        for row in range(parentItem.rowCount()):
+            childItem = parentItem.child(row)
+            tag = '{}/{}'.format(parentTag, childItem.text()) if parentTag else childItem.text()
+            items[tag] = childItem
+            items.update(self.tagItems(childItem, tag))
+        return items
 
     def updateTags(self, index, _):
         self.dataChanged.disconnect(self.updateTags)
@@ -208,6 +406,742 @@ class TagsModel(QtGui.QStandardItemModel):
         self.dataChanged.connect(self.updateTags)
 
 
+class PageJobSignals(QtCore.QObject):
+    done = QtCore.pyqtSignal(int, object)
+
+
+class PageJob(QtCore.QRunnable):
+    def __init__(self, requestId, dbPath, condition, params, stop):
+        QtCore.QRunnable.__init__(self)
+        self.requestId = requestId
+        self.dbPath = dbPath
+        self.condition = condition
+        self.params = params
+        self.stop = stop
+        self.signals = PageJobSignals()
+
+    def run(self):
+        if self.stop.is_set():
+            return
+        try:
+            dbConn = sqlite3.connect(self.dbPath)
+            try:
+                #queries of superseded requests are interrupted
+                dbConn.set_progress_handler(self.stop.is_set, 10000)
+                rows = queryPage(dbConn.cursor(), self.condition, self.params, None, samplePageSize)
+            finally:
+                dbConn.close()
+        except Exception as e:
+            if self.stop.is_set():
+                return
+            print(e)
+            rows = None
+        if not self.stop.is_set():
+            self.signals.done.emit(self.requestId, rows)
+
+
+class SampleTableModel(QtCore.QAbstractTableModel):
+    '''
+    Read-only table of database samples, stored by column: numeric fields
+    are kept in numpy arrays, formats and subtypes as codes of a shared
+    string list, and cell contents are computed only when requested.
+    Per cell data set by the views (icons, fonts, file info) is kept apart,
+    keyed by file path.
+    Query results are loaded in pages with canFetchMore/fetchMore, using the
+    rowid of the last loaded sample as the start of the next page.
+    The first page of a new filter is read in a thread pool with its own
+    database connection, and the current rows are kept until it is ready;
+    a newer request cancels the pending one.
+    '''
+    headers = ['Name', 'Path', 'Length', 'Format', 'Rate', 'Ch.', 'Bits', 'Tags', 'Preview']
+    def __init__(self, db, *args, **kwargs):
+        QtCore.QAbstractTableModel.__init__(self, *args, **kwargs)
+        self.db = db
+        self.playIcon = QtGui.QIcon.fromTheme('media-playback-start')
+        self.flagsValue = QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsDragEnabled
+        self.resetColumns()
+        self.query = self.filter = '', ()
+        self.complete = True
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.requestId = 0
+        self.stop = Event()
+        self.pending = None
+
+    def resetColumns(self):
+        self.filePaths = []
+        self.fileNames = []
+        self.lengths = np.zeros(0, dtype='float64')
+        self.rates = np.zeros(0, dtype='int32')
+        self.channels = np.zeros(0, dtype='int16')
+        self.formatCodes = np.zeros(0, dtype='int32')
+        self.subtypeCodes = np.zeros(0, dtype='int32')
+        self.tags = []
+        self.strings = []
+        self.stringCodes = {}
+        self.cellData = {}
+        self.rows = None
+        self.nameIndex = None
+
+    def stringCode(self, value):
+        try:
+            return self.stringCodes[value]
+        except KeyError:
+            self.stringCodes[value] = len(self.strings)
+            self.strings.append(value)
+            return self.stringCodes[value]
+
+    def appendColumns(self, rows):
+        lengths = []
+        rates = []
+        channels = []
+        formatCodes = []
+        subtypeCodes = []
+        for filePath, fileName, length, format, sampleRate, channelCount, subtype, tagString in rows:
+            self.filePaths.append(filePath)
+            self.fileNames.append(fileName)
+            lengths.append(length)
+            rates.append(sampleRate)
+            channels.append(channelCount)
+            formatCodes.append(self.stringCode(format))
+            subtypeCodes.append(self.stringCode(subtype))
+            self.tags.append(sys.intern(tagString) if tagString else '')
+        self.lengths = np.concatenate((self.lengths, np.array(lengths, dtype='float64')))
+        self.rates = np.concatenate((self.rates, np.array(rates, dtype='int32')))
+        self.channels = np.concatenate((self.channels, np.array(channels, dtype='int16')))
+        self.formatCodes = np.concatenate((self.formatCodes, np.array(formatCodes, dtype='int32')))
+        self.subtypeCodes = np.concatenate((self.subtypeCodes, np.array(subtypeCodes, dtype='int32')))
+        self.rows = None
+        self.nameIndex = None
+
+    def setQuery(self, condition='', params=()):
+        '''
+        Show the samples matching the SQL condition; rows are read from the
+        database in pages, as the view needs them.
+        '''
+        self.query = condition, tuple(params)
+        self.reload()
+
+    def setFilter(self, condition='', params=()):
+        #filters are applied on top of the current query
+        self.filter = condition, tuple(params)
+        self.cancelPage()
+        self.stop = Event()
+        self.pending = self.fullCondition()
+        job = PageJob(self.requestId, self.db.dbFile.absoluteFilePath(), self.pending[0], self.pending[1], self.stop)
+        job.signals.done.connect(self.pageDone)
+        self.pool.start(job)
+
+    def cancelPage(self):
+        self.stop.set()
+        self.requestId += 1
+        self.pending = None
+
+    def pageDone(self, requestId, rows):
+        if requestId != self.requestId or self.pending is None:
+            return
+        condition, params = self.pending
+        self.pending = None
+        if rows is None:
+            #read errors are left to the usual path
+            self.reload()
+            return
+        self.beginResetModel()
+        self.resetColumns()
+        self.condition, self.params = condition, params
+        self.lastRowId = None
+        self.complete = False
+        self.endResetModel()
+        self.appendPage(rows)
+
+    def fullCondition(self):
+        conditions = []
+        fullParams = ()
+        for condition, params in (self.query, self.filter):
+            if condition:
+                conditions.append('({})'.format(condition))
+                fullParams += params
+        return ' AND '.join(conditions), fullParams
+
+    def reload(self):
+        self.cancelPage()
+        self.condition, self.params = self.fullCondition()
+        self.beginResetModel()
+        self.resetColumns()
+        self.lastRowId = None
+        self.complete = False
+        self.endResetModel()
+        #the first page is read immediately, the others when scrolling
+        self.fetchMore()
+
+    def clear(self):
+        self.cancelPage()
+        self.beginResetModel()
+        self.resetColumns()
+        self.complete = True
+        self.endResetModel()
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return not parent.isValid() and not self.complete
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        if parent.isValid() or self.complete:
+            return
+        self.appendPage(self.db.samplePage(self.condition, self.params, self.lastRowId, samplePageSize))
+
+    def appendPage(self, rows):
+        if len(rows) < samplePageSize:
+            self.complete = True
+        if not rows:
+            return
+        self.lastRowId = rows[-1][0]
+        first = len(self.filePaths)
+        self.beginInsertRows(QtCore.QModelIndex(), first, first + len(rows) - 1)
+        self.appendColumns(row[1:] for row in rows)
+        self.endInsertRows()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.filePaths)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole and 0 <= section < len(self.headers):
+            return self.headers[section]
+        return QtCore.QAbstractTableModel.headerData(self, section, orientation, role)
+
+    def flags(self, index):
+        if not index.isValid():
+            return QtCore.Qt.NoItemFlags
+        return self.flagsValue
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        column = index.column()
+        if role == QtCore.Qt.DisplayRole:
+            if column == fileNameColumn:
+                return self.fileNames[row]
+            elif column == dirColumn:
+                return QtCore.QDir.toNativeSeparators(QtCore.QFileInfo(self.filePaths[row]).absolutePath())
+            elif column == lengthColumn:
+                return timeStr(float(self.lengths[row]), trailingAlways=True)
+            elif column == rateColumn:
+                return str(self.rates[row])
+            elif column == channelsColumn:
+                return str(self.channels[row])
+        if role in (QtCore.Qt.DisplayRole, DataRole):
+            if column == formatColumn:
+                return self.strings[self.formatCodes[row]]
+            elif column == subtypeColumn:
+                return self.strings[self.subtypeCodes[row]]
+            elif role == DataRole:
+                if column == lengthColumn:
+                    return float(self.lengths[row])
+                elif column == rateColumn:
+                    return int(self.rates[row])
+                elif column == channelsColumn:
+                    return int(self.channels[row])
+            return None
+        if role == FilePathRole:
+            return self.filePaths[row]
+        if role == TagsRole:
+            if column != tagsColumn:
+                return None
+            return list(filter(None, self.tags[row].split(',')))
+        try:
+            return self.cellData[self.filePaths[row], column][role]
+        except KeyError:
+            if role == QtCore.Qt.DecorationRole and column == fileNameColumn:
+                return self.playIcon
+            return None
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid():
+            return False
+        row = index.row()
+        column = index.column()
+        if role == TagsRole:
+            if column != tagsColumn:
+                return False
+            self.tags[row] = sys.intern(','.join(value)) if value else ''
+        elif role in (QtCore.Qt.DisplayRole, QtCore.Qt.EditRole, DataRole, FilePathRole):
+            return False
+        elif value is None:
+            self.cellData.get((self.filePaths[row], column), {}).pop(role, None)
+        else:
+            self.cellData.setdefault((self.filePaths[row], column), {})[role] = value
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+    def removeRows(self, row, count, parent=QtCore.QModelIndex()):
+        if parent.isValid() or row < 0 or count < 1 or row + count > len(self.filePaths):
+            return False
+        self.beginRemoveRows(parent, row, row + count - 1)
+        for filePath in self.filePaths[row:row + count]:
+            for column in range(len(self.headers)):
+                self.cellData.pop((filePath, column), None)
+        del self.filePaths[row:row + count]
+        del self.fileNames[row:row + count]
+        del self.tags[row:row + count]
+        removed = slice(row, row + count)
+        self.lengths = np.delete(self.lengths, removed)
+        self.rates = np.delete(self.rates, removed)
+        self.channels = np.delete(self.channels, removed)
+        self.formatCodes = np.delete(self.formatCodes, removed)
+        self.subtypeCodes = np.delete(self.subtypeCodes, removed)
+        self.rows = None
+        self.nameIndex = None
+        self.endRemoveRows()
+        return True
+
+    def updateSamples(self, samples):
+        '''
+        Change the file of loaded samples, as a list of (filePath, newPath,
+        info); info can be None if the file contents did not change.
+        '''
+        rows = []
+        lengths = self.lengths.copy()
+        rates = self.rates.copy()
+        channels = self.channels.copy()
+        formatCodes = self.formatCodes.copy()
+        subtypeCodes = self.subtypeCodes.copy()
+        for filePath, newPath, info in samples:
+            row = self.rowForPath(filePath)
+            if row < 0:
+                continue
+            rows.append(row)
+            if newPath != filePath:
+                self.filePaths[row] = newPath
+                self.fileNames[row] = newPath.rpartition('/')[2]
+                for column in range(len(self.headers)):
+                    data = self.cellData.pop((filePath, column), None)
+                    if data is not None:
+                        self.cellData[newPath, column] = data
+            if info is not None:
+                lengths[row] = float(info.frames) / info.samplerate
+                rates[row] = info.samplerate
+                channels[row] = info.channels
+                formatCodes[row] = self.stringCode(info.format)
+                subtypeCodes[row] = self.stringCode(info.subtype)
+        if not rows:
+            return
+        #arrays are replaced, as SampleColumns snapshots might be using them
+        self.lengths = lengths
+        self.rates = rates
+        self.channels = channels
+        self.formatCodes = formatCodes
+        self.subtypeCodes = subtypeCodes
+        self.rows = None
+        self.nameIndex = None
+        self.dataChanged.emit(self.index(min(rows), 0), self.index(max(rows), len(self.headers) - 1), [QtCore.Qt.DisplayRole])
+
+    def rowForPath(self, filePath):
+        #the path index is built on first use and after rows are removed
+        if self.rows is None:
+            self.rows = {filePath: row for row, filePath in enumerate(self.filePaths)}
+        return self.rows.get(filePath, -1)
+
+    def indexFromPath(self, filePath, column=0):
+        row = self.rowForPath(filePath)
+        if row < 0:
+            return QtCore.QModelIndex()
+        return self.index(row, column)
+
+    def filterMask(self, filterData, start=0):
+        '''
+        Evaluate filterData (as emitted by MainFilterWidget) on the rows
+        following start, returning a boolean array.
+        '''
+        columns = SampleColumns(self, start)
+        mask = columns.mask(filterData)
+        if not start:
+            self.nameIndex = columns.nameIndex
+        return mask
+
+
+class SampleColumns(object):
+    '''
+    Snapshot of the SampleTableModel columns used by filters, from row start
+    onwards. The model replaces its arrays instead of changing them, so
+    masks can be computed in another thread while it goes on loading rows.
+    '''
+    def __init__(self, model, start=0):
+        self.start = start
+        self.fileNames = model.fileNames[start:]
+        self.nameIndex = model.nameIndex if not start else None
+        self.lengths = model.lengths[start:]
+        self.rates = model.rates[start:]
+        self.channels = model.channels[start:]
+        self.formatCodes = model.formatCodes[start:]
+        self.stringCodes = dict(model.stringCodes)
+
+    def __len__(self):
+        return len(self.fileNames)
+
+    def nameMask(self, text):
+        #names are searched all at once in a single lowercase string, then
+        #match positions are converted to rows
+        if self.nameIndex is None:
+            names = '\n'.join(self.fileNames).lower()
+            lengths = [len(name) + 1 for name in names.split('\n')]
+            if len(lengths) != len(self.fileNames):
+                #names containing new lines, check them one by one
+                return np.array([text.lower() in name.lower() for name in self.fileNames], dtype=bool)
+            self.nameIndex = names, np.cumsum([0] + lengths)
+        names, starts = self.nameIndex
+        mask = np.zeros(len(starts) - 1, dtype=bool)
+        text = text.lower()
+        if '\n' in text:
+            return mask
+        positions = np.fromiter((match.start() for match in re.finditer(re.escape(text), names)), dtype='int64')
+        mask[np.searchsorted(starts, positions, side='right') - 1] = True
+        return mask
+
+    def mask(self, filterData, stop=None):
+        '''
+        Return a boolean array of the rows accepted by filterData, or None if
+        stop is set before it is complete.
+        '''
+        columns = {
+            lengthColumn: self.lengths, 
+            rateColumn: self.rates, 
+            channelsColumn: self.channels, 
+            }
+        mask = np.ones(len(self), dtype=bool)
+        for filterColumn, data in filterData:
+            if stop is not None and stop.is_set():
+                return None
+            if filterColumn == fileNameColumn:
+                if data:
+                    mask &= self.nameMask(data)
+            elif filterColumn == formatColumn:
+                codes = [self.stringCodes[value] for value in data if value in self.stringCodes]
+                mask &= np.isin(self.formatCodes, codes)
+            elif isinstance(data, list):
+                mask &= np.isin(columns[filterColumn], data)
+            else:
+                values = columns[filterColumn]
+                if data.greater:
+                    greater, greaterEqual = data.greater
+                    mask &= values >= float(greater) if greaterEqual else values > float(greater)
+                if data.less:
+                    less, lessEqual = data.less
+                    mask &= values <= float(less) if lessEqual else values < float(less)
+        return mask
+
+
+class FilterJobSignals(QtCore.QObject):
+    done = QtCore.pyqtSignal(int, object)
+
+
+class FilterJob(QtCore.QRunnable):
+    def __init__(self, requestId, columns, filterData, stop):
+        QtCore.QRunnable.__init__(self)
+        self.requestId = requestId
+        self.columns = columns
+        self.filterData = filterData
+        self.stop = stop
+        self.signals = FilterJobSignals()
+
+    def run(self):
+        #superseded requests still queued in the pool are skipped
+        if self.stop.is_set():
+            return
+        mask = self.columns.mask(self.filterData, self.stop)
+        if mask is not None and not self.stop.is_set():
+            self.signals.done.emit(self.requestId, mask)
+
+
+class SampleFilterProxyModel(QtCore.QAbstractProxyModel):
+    '''
+    Filters a SampleTableModel in memory: filters are evaluated on the
+    model columns with SampleColumns.mask, and the accepted rows are kept
+    as an array mapping proxy rows to source rows (and its inverse). Rows
+    fetched later by the source are filtered as they come.
+    New filters are evaluated in a thread pool and applied at once when
+    ready; the current rows are kept until then, and a newer request
+    cancels the pending one.
+    '''
+    def __init__(self, *args, **kwargs):
+        QtCore.QAbstractProxyModel.__init__(self, *args, **kwargs)
+        self.filterData = []
+        self.rows = np.zeros(0, dtype='int64')
+        self.sourceRows = np.zeros(0, dtype='int64')
+        self.removedRows = None
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.requestId = 0
+        self.stop = Event()
+        self.pending = None
+        #changed whenever source rows are moved, making pending masks invalid
+        self.sourceVersion = 0
+
+    def setSourceModel(self, sourceModel):
+        self.beginResetModel()
+        QtCore.QAbstractProxyModel.setSourceModel(self, sourceModel)
+        sourceModel.modelAboutToBeReset.connect(self.beginResetModel)
+        sourceModel.modelReset.connect(self.sourceReset)
+        sourceModel.rowsInserted.connect(self.sourceRowsInserted)
+        sourceModel.rowsAboutToBeRemoved.connect(self.sourceRowsAboutToBeRemoved)
+        sourceModel.rowsRemoved.connect(self.sourceRowsRemoved)
+        sourceModel.dataChanged.connect(self.sourceDataChanged)
+        self.updateRows()
+        self.endResetModel()
+
+    def setFilterData(self, filterData):
+        self.stop.set()
+        self.requestId += 1
+        self.pending = None
+        filterData = [(filterColumn, data) for filterColumn, data in filterData if data]
+        if not filterData:
+            self.applyFilter(filterData)
+            return
+        self.stop = Event()
+        columns = SampleColumns(self.sourceModel())
+        self.pending = filterData, columns, self.sourceVersion
+        job = FilterJob(self.requestId, columns, filterData, self.stop)
+        job.signals.done.connect(self.jobDone)
+        self.pool.start(job)
+
+    def jobDone(self, requestId, mask):
+        if requestId != self.requestId or self.pending is None:
+            return
+        filterData, columns, sourceVersion = self.pending
+        self.pending = None
+        if sourceVersion != self.sourceVersion:
+            self.setFilterData(filterData)
+            return
+        sourceModel = self.sourceModel()
+        if len(columns) < sourceModel.rowCount():
+            #pages appended since the request only need their own mask
+            mask = np.concatenate((mask, sourceModel.filterMask(filterData, len(columns))))
+        elif sourceModel.nameIndex is None:
+            sourceModel.nameIndex = columns.nameIndex
+        self.applyFilter(filterData, mask)
+
+    def applyFilter(self, filterData, mask=None):
+        self.filterData = filterData
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        sourceIndexes = [self.mapToSource(index) for index in persistent]
+        self.updateRows(mask)
+        self.changePersistentIndexList(persistent, [self.mapFromSource(index) for index in sourceIndexes])
+        self.layoutChanged.emit()
+
+    def updateRows(self, mask=None):
+        sourceCount = self.sourceModel().rowCount()
+        if mask is None and self.filterData:
+            mask = self.sourceModel().filterMask(self.filterData)
+        if mask is not None:
+            self.rows = np.flatnonzero(mask)
+        else:
+            self.rows = np.arange(sourceCount)
+        self.sourceRows = np.full(sourceCount, -1, dtype='int64')
+        self.sourceRows[self.rows] = np.arange(len(self.rows))
+
+    def sourceReset(self):
+        self.sourceVersion += 1
+        self.updateRows()
+        self.endResetModel()
+
+    def sourceRowsInserted(self, parent, first, last):
+        if first != len(self.sourceRows):
+            #rows are only appended by SampleTableModel
+            self.sourceVersion += 1
+            self.applyFilter(self.filterData)
+            return
+        if self.filterData:
+            accepted = first + np.flatnonzero(self.sourceModel().filterMask(self.filterData, first))
+        else:
+            accepted = np.arange(first, last + 1)
+        sourceRows = np.full(last - first + 1, -1, dtype='int64')
+        sourceRows[accepted - first] = len(self.rows) + np.arange(len(accepted))
+        if len(accepted):
+            self.beginInsertRows(QtCore.QModelIndex(), len(self.rows), len(self.rows) + len(accepted) - 1)
+        self.rows = np.concatenate((self.rows, accepted))
+        self.sourceRows = np.concatenate((self.sourceRows, sourceRows))
+        if len(accepted):
+            self.endInsertRows()
+
+    def sourceRowsAboutToBeRemoved(self, parent, first, last):
+        removed = self.sourceRows[first:last + 1]
+        removed = removed[removed >= 0]
+        self.removedRows = first, last, len(removed)
+        if len(removed):
+            self.beginRemoveRows(QtCore.QModelIndex(), int(removed[0]), int(removed[-1]))
+
+    def sourceRowsRemoved(self, parent, first, last):
+        first, last, count = self.removedRows
+        self.removedRows = None
+        self.sourceVersion += 1
+        self.rows = self.rows[(self.rows < first) | (self.rows > last)]
+        self.rows[self.rows > last] -= last - first + 1
+        self.sourceRows = np.delete(self.sourceRows, slice(first, last + 1))
+        self.sourceRows[self.rows] = np.arange(len(self.rows))
+        if count:
+            self.endRemoveRows()
+
+    def sourceDataChanged(self, topLeft, bottomRight, roles=[]):
+        if self.filterData and QtCore.Qt.DisplayRole in roles:
+            #the filtered values might have changed
+            self.sourceVersion += 1
+            self.applyFilter(self.filterData)
+        rows = self.sourceRows[topLeft.row():bottomRight.row() + 1]
+        rows = rows[rows >= 0]
+        if len(rows):
+            self.dataChanged.emit(self.index(int(rows[0]), topLeft.column()), self.index(int(rows[-1]), bottomRight.column()), roles)
+
+    def mapToSource(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        return self.sourceModel().index(int(self.rows[index.row()]), index.column())
+
+    def mapFromSource(self, index):
+        if not index.isValid():
+            return QtCore.QModelIndex()
+        row = self.sourceRows[index.row()]
+        if row < 0:
+            return QtCore.QModelIndex()
+        return self.index(int(row), index.column())
+
+    def index(self, row, column, parent=QtCore.QModelIndex()):
+        if parent.isValid() or not 0 <= row < len(self.rows) or not 0 <= column < self.columnCount():
+            return QtCore.QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=None):
+        return QtCore.QModelIndex()
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.rows)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.sourceModel().columnCount()
+
+
+class ImportSampleModel(QtCore.QAbstractTableModel):
+    '''
+    Samples found by a scan, as shown in the import dialog: rows are stored
+    as lists of values and are appended in batches, each with a single
+    insertion.
+    '''
+    headers = ['Name', 'Path', 'Length', 'Format', 'Rate', 'Ch.', 'Bits', 'Tags']
+    def __init__(self, *args, **kwargs):
+        QtCore.QAbstractTableModel.__init__(self, *args, **kwargs)
+        self.filePaths = []
+        self.infos = []
+        self.tags = []
+        self.checkStates = []
+        self.cellData = {}
+
+    def appendSamples(self, samples, tags):
+        '''
+        Append a list of (filePath, soundfile info) samples, all with tags.
+        '''
+        if not samples:
+            return
+        row = len(self.filePaths)
+        self.beginInsertRows(QtCore.QModelIndex(), row, row + len(samples) - 1)
+        for filePath, info in samples:
+            self.filePaths.append(filePath)
+            self.infos.append(info)
+            self.tags.append(list(tags))
+            self.checkStates.append(QtCore.Qt.Checked)
+        self.endInsertRows()
+
+    def checkedCount(self):
+        return self.checkStates.count(QtCore.Qt.Checked)
+
+    def checkedSamples(self):
+        #(filePath, fileName, info, tags) of samples set for import
+        return [(filePath, filePath.rpartition('/')[2], info, tags) for filePath, info, tags, checkState 
+            in zip(self.filePaths, self.infos, self.tags, self.checkStates) if checkState]
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.filePaths)
+
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.headers)
+
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole and 0 <= section < len(self.headers):
+            return self.headers[section]
+        return QtCore.QAbstractTableModel.headerData(self, section, orientation, role)
+
+    def flags(self, index):
+        if index.column() == fileNameColumn:
+            return QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled | QtCore.Qt.ItemIsUserCheckable
+        return QtCore.Qt.ItemIsSelectable | QtCore.Qt.ItemIsEnabled
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row = index.row()
+        column = index.column()
+        filePath = self.filePaths[row]
+        if role == QtCore.Qt.DisplayRole:
+            info = self.infos[row]
+            if column == fileNameColumn:
+                return filePath.rpartition('/')[2]
+            elif column == dirColumn:
+                return filePath.rpartition('/')[0]
+            elif column == lengthColumn:
+                return '{:.3f}'.format(float(info.frames) / info.samplerate)
+            elif column == formatColumn:
+                return info.format
+            elif column == rateColumn:
+                return str(info.samplerate)
+            elif column == channelsColumn:
+                return str(info.channels)
+            elif column == subtypeColumn:
+                return info.subtype
+        elif role == QtCore.Qt.ToolTipRole:
+            if column == fileNameColumn:
+                return filePath.rpartition('/')[2]
+            elif column == dirColumn:
+                return filePath
+        elif role == QtCore.Qt.CheckStateRole:
+            if column == fileNameColumn:
+                return self.checkStates[row]
+        elif role == FilePathRole:
+            return filePath
+        elif role == InfoRole:
+            return self.infos[row]
+        elif role == TagsRole:
+            if column == tagsColumn:
+                return self.tags[row]
+        return self.cellData.get((row, column, role))
+
+    def setData(self, index, value, role=QtCore.Qt.EditRole):
+        if not index.isValid():
+            return False
+        row = index.row()
+        column = index.column()
+        if role == QtCore.Qt.CheckStateRole and column == fileNameColumn:
+            self.checkStates[row] = value
+        elif role == TagsRole and column == tagsColumn:
+            self.tags[row] = value
+        else:
+            self.cellData[(row, column, role)] = value
+        self.dataChanged.emit(index, index, [role])
+        return True
+
+
 class SampleSortFilterProxyModel(QtCore.QSortFilterProxyModel):
     def __init__(self, *args, **kwargs):
         QtCore.QSortFilterProxyModel.__init__(self, *args, **kwargs)
@@ -232,18 +1166,18 @@ class SampleSortFilterProxyModel(QtCore.QSortFilterProxyModel):
         if not self.currentFilterData:
             if not self.currentTextFilter:
                 return True
-            if self.currentTextFilter.lower() in self.sourceModel().item(row, fileNameColumn).text().lower():
+            if self.currentTextFilter.lower() in self.sourceModel().index(row, fileNameColumn).data().lower():
                 return True
         else:
             for filterColumn, filterData in self.currentFilterData.items():
                 if isinstance(filterData, list):
                     for item in filterData:
-                        if self.sourceModel().item(row, filterColumn).data(DataRole) == item:
+                        if self.sourceModel().index(row, filterColumn).data(DataRole) == item:
                             break
                     else:
                         return False
                 else:
-                    value = self.sourceModel().item(row, filterColumn).data(DataRole)
+                    value = self.sourceModel().index(row, filterColumn).data(DataRole)
                     if filterData.greater:
                         greater, greaterEqual = filterData.greater
                         greater = float(greater)
@@ -254,7 +1188,7 @@ class SampleSortFilterProxyModel(QtCore.QSortFilterProxyModel):
                         less = float(less)
                         if (less < value) or (not lessEqual and less <= value):
                             return False
-            if not self.currentTextFilter or self.currentTextFilter.lower() in self.sourceModel().item(row, fileNameColumn).text().lower():
+            if not self.currentTextFilter or self.currentTextFilter.lower() in self.sourceModel().index(row, fileNameColumn).data().lower():
                 return True
         return False
 
@@ -296,13 +1230,52 @@ class DirIterator(object):
         return MultiDirIterator(self, dirList, *args, **kwargs)
 
 
+def probeFile(filePath, knownFingerprint=None):
+    '''
+    Return the fingerprint of filePath and its soundfile info; the file is
+    not read if it matches knownFingerprint, and info is None in that case
+    or if the file is not a valid sample.
+    '''
+    fingerprint = fileFingerprint(filePath)
+    if fingerprint is not None and fingerprint == knownFingerprint:
+        return fingerprint, None
+    try:
+        return fingerprint, sampleInfo(filePath)
+    except:
+        return fingerprint, None
+
+
 class Crawler(QtCore.QObject):
+    '''
+    Walks directories looking for samples; file headers are probed in a pool
+    of scanThreads threads while the walk goes on, and results are checked
+    and emitted in the same order files are found, as lists of (QFileInfo,
+    soundfile info).
+    knownFiles maps the paths of samples already in the database to their
+    fingerprint: those that did not change are skipped without being read,
+    those that changed are emitted as changed at the end, as a list of
+    (filePath, info, fingerprint) to be updated in place (info is None if
+    only the fingerprint has to be stored), and those that no longer exist
+    are emitted as missing.
+    '''
     currentBrowseDir = QtCore.pyqtSignal(str)
-    found = QtCore.pyqtSignal(object, object)
+    found = QtCore.pyqtSignal(object)
+    changed = QtCore.pyqtSignal(object)
+    missing = QtCore.pyqtSignal(object)
+    #files checked, unchanged files and files per second
+    progress = QtCore.pyqtSignal(int, int, float)
     done = QtCore.pyqtSignal()
-    def __init__(self, dirPath, scanMode, formats, sampleRates, channels, scanLimits):
+    def __init__(self, dirPath, scanMode, formats, sampleRates, channels, scanLimits, scanThreads=defaultScanThreads, knownFiles=None):
         QtCore.QObject.__init__(self)
         self.stop = Event()
+        self.scanThreads = max(1, scanThreads)
+        self.knownFiles = knownFiles if knownFiles is not None else {}
+        self.probed = 0
+        self.unchanged = 0
+        self.startTime = self.lastProgress = 0
+        self.foundBatch = []
+        self.changedFiles = []
+        self.lastFound = 0
         self.dirPath = dirPath
         self.scanMode = scanMode
         self.formats = formats
@@ -371,20 +1344,76 @@ class Crawler(QtCore.QObject):
 
 
     def run(self):
-        while self.iterator.hasNext() and not self.stop.is_set():
-            filePath = self.iterator.next()
-            fileInfo = self.iterator.fileInfo()
-#            use an internal function to update directory?
-#            self.currentBrowseDir.emit(self.iterator.filePath())
+        self.probed = 0
+        self.unchanged = 0
+        self.startTime = self.lastProgress = self.lastFound = time.time()
+        self.foundBatch = []
+        self.changedFiles = []
+        seen = set()
+        pending = deque()
+        with ThreadPoolExecutor(self.scanThreads) as executor:
+            while self.iterator.hasNext() and not self.stop.is_set():
+                filePath = self.iterator.next()
+                fileInfo = self.iterator.fileInfo()
+#                use an internal function to update directory?
+#                self.currentBrowseDir.emit(self.iterator.filePath())
+                absolutePath = fileInfo.absoluteFilePath()
+                seen.add(absolutePath)
+                knownFingerprint = self.knownFiles.get(absolutePath)
+                pending.append((fileInfo, knownFingerprint, executor.submit(probeFile, filePath, knownFingerprint)))
+                #results are consumed in order, waiting only if the queue is full
+                while pending and not self.stop.is_set() and (pending[0][2].done() or len(pending) >= self.scanThreads * scanQueueSize):
+                    self.checkProbe(*pending.popleft())
+            while pending and not self.stop.is_set():
+                self.checkProbe(*pending.popleft())
+            for fileInfo, knownFingerprint, future in pending:
+                future.cancel()
+        self.emitFound()
+        self.emitProgress()
+        if self.changedFiles:
+            self.changed.emit(self.changedFiles)
+        if not self.stop.is_set():
+            #known files might have been excluded by the scan file patterns
+            self.missing.emit([filePath for filePath in self.knownFiles 
+                if filePath not in seen and fileFingerprint(filePath) is None])
+        self.done.emit()
+
+    def checkProbe(self, fileInfo, knownFingerprint, future):
+        fingerprint, info = future.result()
+        self.probed += 1
+        if fingerprint is not None and fingerprint == knownFingerprint:
+            self.unchanged += 1
+        elif knownFingerprint is not None:
+            #known samples are not imported again, which would reset their tags
+            if fingerprint is not None and knownFingerprint == (None, None, None):
+                #samples imported before fingerprints were stored
+                self.changedFiles.append((fileInfo.absoluteFilePath(), None, fingerprint))
+            elif info is not None:
+                self.changedFiles.append((fileInfo.absoluteFilePath(), info, fingerprint))
+        elif info is not None:
             try:
-                info = soundfile.info(filePath)
                 for method in self.methodList:
                     if not method(fileInfo, info):
                         break
                 else:
-                    self.found.emit(fileInfo, info)
+                    self.foundBatch.append((fileInfo, info))
             except:
                 pass
-        self.done.emit()
+        now = time.time()
+        if len(self.foundBatch) >= foundBatchSize or now - self.lastFound >= foundBatchInterval:
+            self.emitFound()
+        if now - self.lastProgress >= scanProgressInterval:
+            self.emitProgress()
+
+    def emitFound(self):
+        self.lastFound = time.time()
+        if self.foundBatch:
+            self.found.emit(self.foundBatch)
+            self.foundBatch = []
+
+    def emitProgress(self):
+        self.lastProgress = time.time()
+        elapsed = self.lastProgress - self.startTime
+        self.progress.emit(self.probed, self.unchanged, self.probed / elapsed if elapsed else 0)
 
 
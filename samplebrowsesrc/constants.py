@@ -42,8 +42,25 @@ channelsLabels = {
     8: '7.1'
     }
 
+#destination of each channel when downmixing to stereo: L and R go to their
+#side, M (center, sub) to both; layouts follow the ordering of channelsLabels
+downmixLayouts = {
+    1: 'M', 
+    2: 'LR', 
+    3: 'LRM', 
+    4: 'LRLR', 
+    5: 'LRLRM', 
+    6: 'LRLRMM', 
+    7: 'LRLRMMM', 
+    8: 'LRLRMMLR', 
+    }
+
 dbFields = ['filePath', 'fileName', 'length', 'format', 'sampleRate', 'channels', 'subtype', 'tags', 'preview']
 dbFieldsOld = ['filePath', 'fileName', 'length', 'format', 'sampleRate', 'channels', 'tags', 'preview']
+#fields added later, used to detect changed files when scanning again
+fingerprintFields = ['fileSize', 'mtime', 'inode']
+#columns loaded for the database sample view; previews are read on demand
+sampleViewFields = ', '.join('samples.' + field for field in dbFields[:-1])
 
 fileNameColumn, dirColumn, lengthColumn, formatColumn, rateColumn, channelsColumn, subtypeColumn, tagsColumn, previewColumn = range(9)
 allColumns = fileNameColumn, dirColumn, lengthColumn, formatColumn, rateColumn, channelsColumn, subtypeColumn, tagsColumn, previewColumn
@@ -75,7 +92,7 @@ TagsRole = WaveRole + 1
 PreviewRole = TagsRole + 1
 
 StatusBackup, StatusSamplesAdded, StatusSamplesRemoved, StatusSamplesTagsEdited, \
-    StatusTagRenamed, StatusTagChanged, StatusTagRemoved, StatusFavAdded, StatusFavRemoved = range(9)
+    StatusTagRenamed, StatusTagChanged, StatusTagRemoved, StatusFavAdded, StatusFavRemoved, StatusDbSynced = range(10)
 
 StatusDict = {
     StatusBackup: lambda done: 'Backup completed.' if done else 'Backup failed!', 
@@ -87,4 +104,5 @@ StatusDict = {
     StatusTagRemoved: lambda tag: 'Tag "{}" removed'.format(tag), 
     StatusFavAdded: lambda fav: 'Favourite "{}" created'.format(fav), 
     StatusFavRemoved: lambda fav: 'Favourite "{}" removed'.format(fav), 
+    StatusDbSynced: lambda n: 'Database updated for {} changed file{}'.format(n, 's' if n>1 else ''), 
     }
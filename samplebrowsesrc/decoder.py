@@ -0,0 +1,238 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+import numpy as np
+import soundfile
+import samplerate
+
+#frames decoded at once when streaming
+streamBlockSize = 65536
+#default decoded audio cache budget, in megabytes
+defaultAudioCacheSize = 256
+
+
+class WaveStream(object):
+    '''
+    Streaming reader for audio files, decoding them in fixed-size float32
+    blocks instead of loading the whole file in memory.
+    '''
+    def __init__(self, filePath, blockSize=streamBlockSize):
+        self.filePath = filePath
+        self.blockSize = blockSize
+        with soundfile.SoundFile(filePath) as sf:
+            self.frames = sf.frames
+            self.channels = sf.channels
+            self.samplerate = sf.samplerate
+
+    def blocks(self, start=0):
+        with soundfile.SoundFile(self.filePath) as sf:
+            if start:
+                sf.seek(start)
+            for block in sf.blocks(self.blockSize, dtype='float32', always_2d=True):
+                yield block
+
+    def read(self):
+        blocks = list(self.blocks())
+        if not blocks:
+            return np.zeros((0, self.channels), dtype='float32')
+        return np.concatenate(blocks)
+
+
+class ArrayStream(object):
+    '''
+    Same interface as WaveStream, for data that is already decoded.
+    '''
+    def __init__(self, waveData, samplerate, blockSize=streamBlockSize):
+        self.waveData = waveData
+        self.blockSize = blockSize
+        self.frames, self.channels = waveData.shape
+        self.samplerate = samplerate
+
+    def blocks(self, start=0):
+        for pos in range(start, self.frames, self.blockSize):
+            yield self.waveData[pos:pos + self.blockSize]
+
+    def read(self):
+        return self.waveData
+
+
+class ResampledStream(object):
+    '''
+    Converts the sample rate of another stream block by block, while its
+    blocks are consumed.
+    '''
+    def __init__(self, stream, sampleRate, conversion='sinc_fastest'):
+        self.stream = stream
+        self.samplerate = sampleRate
+        self.conversion = conversion
+        self.channels = stream.channels
+        #ratio is output/input
+        self.ratio = sampleRate / stream.samplerate
+        self.frames = int(stream.frames * self.ratio)
+
+    def blocks(self, start=0):
+        resampler = samplerate.Resampler(self.conversion, self.channels)
+        source = self.stream.blocks(int(start / self.ratio))
+        try:
+            block = next(source, None)
+            while block is not None:
+                nextBlock = next(source, None)
+                data = resampler.process(block, self.ratio, end_of_input=nextBlock is None)
+                if len(data):
+                    yield data.astype('float32', copy=False).reshape(-1, self.channels)
+                block = nextBlock
+        finally:
+            if hasattr(source, 'close'):
+                source.close()
+
+    def read(self):
+        blocks = list(self.blocks())
+        if not blocks:
+            return np.zeros((0, self.channels), dtype='float32')
+        return np.concatenate(blocks)
+
+
+class CachingStream(object):
+    '''
+    Passes the blocks of another stream through, and stores the decoded data
+    in the audio cache once it has been read from the start to the end, so
+    that caching never delays the first block.
+    '''
+    def __init__(self, stream, cache, key):
+        self.stream = stream
+        self.cache = cache
+        self.key = key
+        self.channels = stream.channels
+        self.samplerate = stream.samplerate
+        self.frames = stream.frames
+
+    def blocks(self, start=0):
+        source = self.stream.blocks(start)
+        if start:
+            #partial reads (after seeking) are not cached
+            yield from source
+            return
+        blocks = []
+        for block in source:
+            blocks.append(block)
+            yield block
+        waveData = np.concatenate(blocks) if blocks else np.zeros((0, self.channels), dtype='float32')
+        self.cache.put(self.key, ArrayStream(waveData, self.samplerate))
+
+    def read(self):
+        blocks = list(self.blocks())
+        if not blocks:
+            return np.zeros((0, self.channels), dtype='float32')
+        return np.concatenate(blocks)
+
+
+class AudioCache(object):
+    '''
+    Process-wide LRU cache of decoded audio, bounded by the total size in
+    bytes of the cached arrays. Entries are keyed by file path, modification
+    time and size, so that changed files are decoded again.
+    '''
+    def __init__(self, maxBytes=defaultAudioCacheSize * 1048576):
+        self.maxBytes = maxBytes
+        self.currentBytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = Lock()
+
+    def key(self, filePath):
+        try:
+            stat = os.stat(filePath)
+        except OSError:
+            return None
+        return filePath, stat.st_mtime_ns, stat.st_size
+
+    def get(self, key):
+        with self.lock:
+            try:
+                stream = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return None
+            self.entries[key] = stream
+            self.hits += 1
+            return stream
+
+    def put(self, key, stream):
+        size = stream.waveData.nbytes
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.currentBytes -= old.waveData.nbytes
+            if size > self.maxBytes:
+                return False
+            self.entries[key] = stream
+            self.currentBytes += size
+            self._evict()
+        return True
+
+    def setMaxBytes(self, maxBytes):
+        with self.lock:
+            self.maxBytes = maxBytes
+            self._evict()
+
+    def _evict(self):
+        while self.currentBytes > self.maxBytes and self.entries:
+            key, stream = self.entries.popitem(last=False)
+            self.currentBytes -= stream.waveData.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.currentBytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries), 
+                'bytes': self.currentBytes, 
+                'maxBytes': self.maxBytes, 
+                'hits': self.hits, 
+                'misses': self.misses, 
+                }
+
+
+audioCache = AudioCache()
+
+
+def openWave(filePath, sampleRate=None, conversion='sinc_fastest', cache=audioCache):
+    '''
+    Return a stream for filePath, decoded from the cache if possible; files
+    bigger than a quarter of the cache budget are always streamed from disk.
+    If sampleRate is given, the stream is converted to it block by block.
+    Nothing is decoded before returning: files that fit in the cache are
+    stored there (also at sampleRate) once their stream has been read
+    completely, see fillCache.
+    '''
+    key = cache.key(filePath)
+    if key is None:
+        raise IOError('File not found: {}'.format(filePath))
+    stream = cache.get(key)
+    if stream is None:
+        stream = WaveStream(filePath)
+        if stream.frames * stream.channels * 4 > cache.maxBytes // 4:
+            if sampleRate is None or stream.samplerate == sampleRate:
+                return stream
+            return ResampledStream(stream, sampleRate, conversion)
+        stream = CachingStream(stream, cache, key)
+    if sampleRate is None or stream.samplerate == sampleRate:
+        return stream
+    rateKey = key + (sampleRate, conversion)
+    resampled = cache.get(rateKey)
+    if resampled is None:
+        resampled = CachingStream(ResampledStream(stream, sampleRate, conversion), cache, rateKey)
+    return resampled
+
+
+def fillCache(stream):
+    '''
+    Read a stream returned by openWave completely if it is to be cached, as
+    when prefetching.
+    '''
+    if isinstance(stream, CachingStream):
+        stream.read()
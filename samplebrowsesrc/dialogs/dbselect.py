@@ -105,7 +105,7 @@ class DbSelectDialog(QtWidgets.QDialog):
             if not tables:
                 return self.dbOk
             fields = [f[1] for f in dbCursor.execute('PRAGMA table_info(samples)').fetchall()]
-            if fields != dbFields and fields != dbFieldsOld:
+            if fields[:len(dbFields)] != dbFields and fields != dbFieldsOld:
                 return self.dbError
             return self.dbOk
         except:
@@ -1,21 +1,20 @@
 import os
-import soundfile
 from PyQt5 import QtCore, QtGui, QtWidgets, uic
 from samplebrowsesrc import utils
 from samplebrowsesrc.constants import *
+from samplebrowsesrc.probe import sampleInfo
 from samplebrowsesrc.dialogs.tagseditor import TagsEditorDialog
-from samplebrowsesrc.classes import SampleSortFilterProxyModel, Crawler
+from samplebrowsesrc.classes import ImportSampleModel, SampleSortFilterProxyModel, Crawler, defaultScanThreads
 from samplebrowsesrc.widgets import AlignItemDelegate, TagListDelegate, SubtypeDelegate
 
 class ImportDialog(QtWidgets.QDialog):
     def __init__(self, parent):
         QtWidgets.QDialog.__init__(self, parent)
         uic.loadUi('{}/importdialog.ui'.format(os.path.dirname(utils.__file__)), self)
-        self.sampleModel = QtGui.QStandardItemModel()
+        self.sampleModel = ImportSampleModel()
         self.sampleProxyModel = SampleSortFilterProxyModel()
         self.sampleProxyModel.setSourceModel(self.sampleModel)
         self.sampleView.setModel(self.sampleProxyModel)
-        self.sampleModel.setHorizontalHeaderLabels(['Name', 'Path', 'Length', 'Format', 'Rate', 'Ch.', 'Bits', 'Tags'])
 
         self.elidedItemDelegate = AlignItemDelegate(QtCore.Qt.AlignLeft, QtCore.Qt.ElideMiddle)
         self.sampleView.setItemDelegateForColumn(1, self.elidedItemDelegate)
@@ -117,26 +116,12 @@ class ImportDialog(QtWidgets.QDialog):
         self.checkChecked()
 
     def checkChecked(self, *args):
-        checked = 0
-        for row in range(self.sampleModel.rowCount()):
-            if self.sampleModel.item(row, 0).checkState():
-                checked += 1
-        self.selectedLbl.setText(str(checked))
+        self.selectedLbl.setText(str(self.sampleModel.checkedCount()))
 
     def exec_(self):
         res = QtWidgets.QDialog.exec_(self)
         if res:
-            sampleList = []
-            for row in range(self.sampleModel.rowCount()):
-                fileItem = self.sampleModel.item(row, 0)
-                if not fileItem.checkState():
-                    continue
-                fileName = fileItem.text()
-                filePath = fileItem.data(FilePathRole)
-                info = fileItem.data(InfoRole)
-                tags = self.sampleModel.item(row, tagsColumn).data(TagsRole)
-                sampleList.append((filePath, fileName, info, tags))
-            return sampleList
+            return self.sampleModel.checkedSamples()
         else:
             return res
 
@@ -144,7 +129,9 @@ class ImportDialog(QtWidgets.QDialog):
 class ImportDialogScan(ImportDialog):
     def __init__(self, parent, dirList, scanMode, formats, sampleRates, channels, scanLimits):
         ImportDialog.__init__(self, parent)
-        self.crawler = Crawler(dirList, scanMode, formats, sampleRates, channels, scanLimits)
+        scanThreads = QtCore.QSettings().value('scanThreads', defaultScanThreads, type=int)
+        knownFiles = parent.sampleDb.fingerprints(dirList)
+        self.crawler = Crawler(dirList, scanMode, formats, sampleRates, channels, scanLimits, scanThreads, knownFiles)
         self.crawlerThread = QtCore.QThread()
         self.crawler.moveToThread(self.crawlerThread)
         self.crawlerThread.started.connect(self.crawler.run)
@@ -153,36 +140,34 @@ class ImportDialogScan(ImportDialog):
 #        self.popup.rejected.connect(lambda: self.crawler.stop.set())
         self.popup.button(self.popup.Cancel).clicked.connect(lambda: self.crawler.stop.set())
         self.crawler.found.connect(self.found)
+        self.crawler.progress.connect(self.updatePopupProgress)
+        self.crawler.changed.connect(self.setChanged)
+        self.crawler.missing.connect(self.setMissing)
         self.crawler.done.connect(self.popup.close)
         self.crawler.done.connect(self.scanDone)
         self.defaultTags = []
+        self.changedSamples = []
+        self.missingPaths = []
 
     def updatePopupDir(self, dirPath):
         self.popup.setInformativeText('Current path:\n{}'.format(dirPath[:-24]))
 
-    def found(self, fileInfo, info):
-        fileItem = QtGui.QStandardItem(fileInfo.fileName())
-        fileItem.setData(fileInfo.absoluteFilePath(), FilePathRole)
-        fileItem.setData(info, InfoRole)
-        fileItem.setToolTip(fileInfo.fileName())
-        fileItem.setCheckable(True)
-        fileItem.setCheckState(QtCore.Qt.Checked)
-        dirItem = QtGui.QStandardItem(fileInfo.absolutePath())
-        dirItem.setToolTip(fileInfo.absoluteFilePath())
-        lengthItem = QtGui.QStandardItem('{:.3f}'.format(float(info.frames) / info.samplerate))
-        formatItem = QtGui.QStandardItem(info.format)
-        rateItem = QtGui.QStandardItem(str(info.samplerate))
-        channelsItem = QtGui.QStandardItem(str(info.channels))
-        subtypeItem = QtGui.QStandardItem(info.subtype)
-        tagsItem = QtGui.QStandardItem()
-        tagsItem.setData(self.defaultTags, TagsRole)
-        self.sampleModel.appendRow([fileItem, dirItem, lengthItem, formatItem, rateItem, channelsItem, subtypeItem, tagsItem])
-        if not self.sampleModel.rowCount() % 50:
-            self.sampleView.scrollToBottom()
-            found = str(self.sampleModel.rowCount())
-            self.totalLbl.setText(found)
-            self.selectedLbl.setText(found)
-            self.popup.setInformativeText('Samples found: ' + found)
+    def updatePopupProgress(self, probed, unchanged, rate):
+        self.popup.setInformativeText('Samples found: {}\nUnchanged samples: {}\nFiles scanned: {} ({:.0f} files/s)'.format(
+            self.sampleModel.rowCount(), unchanged, probed, rate))
+
+    def setChanged(self, samples):
+        self.changedSamples = samples
+
+    def setMissing(self, filePaths):
+        self.missingPaths = filePaths
+
+    def found(self, samples):
+        self.sampleModel.appendSamples([(fileInfo.absoluteFilePath(), info) for fileInfo, info in samples], self.defaultTags)
+        self.sampleView.scrollToBottom()
+        found = str(self.sampleModel.rowCount())
+        self.totalLbl.setText(found)
+        self.selectedLbl.setText(found)
 #        self.foundSamples.append(filePath)
 #        self.popup.setDetailedText('Samples found: {}'.format(len(self.foundSamples)))
 
@@ -212,31 +197,19 @@ class ImportDialogScanDnD(ImportDialogScan):
             self.defaultTags = [tag]
         else:
             ImportDialog.__init__(self, parent)
+            self.changedSamples = []
+            self.missingPaths = []
         unknownFiles = []
         self.dirList = dirList
+        samples = []
         for filePath in fileList:
             try:
-                info = soundfile.info(filePath)
+                info = sampleInfo(filePath)
             except:
                 unknownFiles.append(filePath)
                 continue
-            fileInfo = QtCore.QFileInfo(filePath)
-            fileItem = QtGui.QStandardItem(fileInfo.fileName())
-            fileItem.setData(filePath, FilePathRole)
-            fileItem.setData(info, InfoRole)
-            fileItem.setToolTip(fileInfo.fileName())
-            fileItem.setCheckable(True)
-            fileItem.setCheckState(QtCore.Qt.Checked)
-            dirItem = QtGui.QStandardItem(fileInfo.absolutePath())
-            dirItem.setToolTip(fileInfo.absoluteFilePath())
-            lengthItem = QtGui.QStandardItem('{:.3f}'.format(float(info.frames) / info.samplerate))
-            formatItem = QtGui.QStandardItem(info.format)
-            rateItem = QtGui.QStandardItem(str(info.samplerate))
-            channelsItem = QtGui.QStandardItem(str(info.channels))
-            subtypeItem = QtGui.QStandardItem(info.subtype)
-            tagsItem = QtGui.QStandardItem()
-            tagsItem.setData([tag], TagsRole)
-            self.sampleModel.appendRow([fileItem, dirItem, lengthItem, formatItem, rateItem, channelsItem, subtypeItem, tagsItem])
+            samples.append((QtCore.QFileInfo(filePath).absoluteFilePath(), info))
+        self.sampleModel.appendSamples(samples, [tag])
 
     def exec_(self):
         if self.sampleModel.rowCount() == 0 and not self.dirList:
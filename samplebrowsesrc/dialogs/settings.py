@@ -2,6 +2,7 @@ import os
 from PyQt5 import QtCore, QtWidgets, uic
 
 from samplebrowsesrc import utils
+from samplebrowsesrc.decoder import audioCache, defaultAudioCacheSize
 from samplebrowsesrc.dialogs.audiosettings import AudioSettingsDialog
 
 
@@ -106,6 +107,8 @@ class SettingsDialog(QtWidgets.QDialog):
 
         self.dbBackupChk.setChecked(self.settings.value('dbBackup', True, type=bool))
         self.dbBackupSpin.setValue(self.settings.value('dbBackupInterval', 5, type=int))
+        self.dbWatchChk.setChecked(self.settings.value('dbWatch', False, type=bool))
+        self.dbWatchPollChk.setChecked(self.settings.value('dbWatchPolling', False, type=bool))
         dataDir = QtCore.QDir(QtCore.QStandardPaths.standardLocations(QtCore.QStandardPaths.AppDataLocation)[0])
         dbFile = QtCore.QFile(dataDir.filePath('sample.sqlite'))
         self.dbPathEdit.setText(self.settings.value('dbPath', dbFile.fileName(), type=str))
@@ -114,6 +117,10 @@ class SettingsDialog(QtWidgets.QDialog):
         self.defaultVolumeGroup.button(defaultVolumeMode).setChecked(True)
         customVolume = self.settings.value('customVolume', self.parent().volumeSlider.value(), type=int)
         self.defaultVolumeCustomSpin.setValue(customVolume)
+        self.audioCacheSpin.setValue(self.settings.value('audioCacheSize', defaultAudioCacheSize, type=int))
+        stats = audioCache.stats()
+        self.audioCacheLbl.setToolTip('{} samples cached ({}), {} hits, {} misses'.format(
+            stats['entries'], utils.sizeStr(stats['bytes']), stats['hits'], stats['misses']))
 
         res = QtWidgets.QDialog.exec_(self)
         if not res:
@@ -121,6 +128,8 @@ class SettingsDialog(QtWidgets.QDialog):
         self.settings.setValue('startupView', self.startupViewGroup.checkedId())
         self.settings.setValue('defaultVolumeMode', self.defaultVolumeGroup.checkedId())
         self.settings.setValue('customVolume', self.defaultVolumeCustomSpin.value())
+        self.settings.setValue('audioCacheSize', self.audioCacheSpin.value())
+        audioCache.setMaxBytes(self.audioCacheSpin.value() * 1048576)
         if self.scanAllChk.isChecked():
             self.settings.setValue('scanAll', True)
         else:
@@ -131,6 +140,8 @@ class SettingsDialog(QtWidgets.QDialog):
             self.settings.remove('showAll')
         self.settings.setValue('dbBackup', self.dbBackupChk.isChecked())
         self.settings.setValue('dbBackupInterval', self.dbBackupSpin.value())
+        self.settings.setValue('dbWatch', self.dbWatchChk.isChecked())
+        self.settings.setValue('dbWatchPolling', self.dbWatchPollChk.isChecked())
         self.settings.sync()
 
 
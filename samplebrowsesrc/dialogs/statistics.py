@@ -7,7 +7,7 @@ class StatsDialog(QtWidgets.QDialog):
         QtWidgets.QDialog.__init__(self, parent)
         uic.loadUi('{}/stats.ui'.format(os.path.dirname(utils.__file__)), self)
         self.sampleDb = parent.sampleDb
-        self.sampleDb.execute('SELECT * from samples')
+        self.sampleDb.execute('SELECT filePath, length, format, sampleRate, channels from samples')
         sampleCount = 0
         missing = 0
         dirs = set()
@@ -16,7 +16,7 @@ class StatsDialog(QtWidgets.QDialog):
         formats = {}
         sampleRates = {}
         channelsDict = {}
-        for filePath, fileName, length, format, sampleRate, channels, subtype, tags, preview in self.sampleDb.fetchall():
+        for filePath, length, format, sampleRate, channels in self.sampleDb.fetchall():
             sampleCount += 1
             fileInfo = QtCore.QFileInfo(filePath)
             if not fileInfo.exists():
@@ -0,0 +1,199 @@
+import os
+import hashlib
+from threading import get_ident, Lock
+import numpy as np
+
+#the finest level never has more than this many blocks, so that the pyramid
+#size does not depend on the file length
+maxBaseBlocks = 65536
+minBlockSize = 16
+#coarser levels are computed until they are shorter than this
+minLevelBlocks = 256
+#size of the peak cache in MB; when exceeded, the least recently used
+#pyramids are removed until it is back to pruneRatio of it
+defaultPeakCacheSize = 512
+pruneRatio = .8
+
+
+class Peaks(object):
+    '''
+    Min/max pyramid of a wave file: level n contains the minimum and maximum
+    value for each channel over blocks of blockSizes[n] frames.
+    '''
+    def __init__(self, frames, channels, blockSizes, levels):
+        self.frames = frames
+        self.channels = channels
+        self.blockSizes = list(blockSizes)
+        self.levels = levels
+
+    @staticmethod
+    def baseBlockSize(frames):
+        blockSize = minBlockSize
+        while frames // blockSize > maxBaseBlocks:
+            blockSize *= 2
+        return blockSize
+
+    @classmethod
+    def fromStream(cls, stream, stop=None):
+        #blocks are reduced as they are decoded, only the base level is kept
+        blockSize = cls.baseBlockSize(stream.frames)
+        mins = []
+        maxs = []
+        frames = 0
+        pending = None
+        for block in stream.blocks():
+            if stop is not None and stop.is_set():
+                return None
+            frames += len(block)
+            if pending is not None:
+                block = np.concatenate((pending, block))
+            full = len(block) // blockSize * blockSize
+            if full:
+                starts = np.arange(0, full, blockSize)
+                mins.append(np.minimum.reduceat(block[:full], starts, axis=0))
+                maxs.append(np.maximum.reduceat(block[:full], starts, axis=0))
+            pending = block[full:] if full < len(block) else None
+        if pending is not None:
+            mins.append(pending.min(axis=0, keepdims=True))
+            maxs.append(pending.max(axis=0, keepdims=True))
+        if not mins:
+            mins = maxs = [np.zeros((1, stream.channels), dtype='float32')]
+        return cls.fromBaseLevel(frames, blockSize, np.concatenate(mins), np.concatenate(maxs))
+
+    @classmethod
+    def fromBaseLevel(cls, frames, blockSize, mins, maxs):
+        level = np.stack((mins, maxs)).astype('float32')
+        blockSizes = [blockSize]
+        levels = {0: level}
+        while level.shape[1] > minLevelBlocks:
+            starts = np.arange(0, level.shape[1], 2)
+            level = np.stack((
+                np.minimum.reduceat(level[0], starts, axis=0),
+                np.maximum.reduceat(level[1], starts, axis=0),
+                ))
+            levels[len(blockSizes)] = level
+            blockSizes.append(blockSizes[-1] * 2)
+        return cls(frames, level.shape[2], blockSizes, levels)
+
+    def level(self, index):
+        return self.levels[index]
+
+    def envelope(self, width):
+        #resolution is 5 samples per scene pixel
+        step = max(1, self.frames // (max(1, width) * 5))
+        index = 0
+        for levelIndex, blockSize in enumerate(self.blockSizes):
+            if blockSize > step:
+                break
+            index = levelIndex
+        blockSize = self.blockSizes[index]
+        level = self.level(index)
+        group = max(1, step // blockSize)
+        if group > 1:
+            starts = np.arange(0, level.shape[1], group)
+            mins = np.minimum.reduceat(level[0], starts, axis=0)
+            maxs = np.maximum.reduceat(level[1], starts, axis=0)
+        else:
+            mins, maxs = level
+        return mins, maxs, blockSize * group
+
+
+class PeakCache(object):
+    '''
+    On disk cache of Peaks pyramids, keyed by file path, modification time
+    and size, so that waveforms are computed only once per file.
+    Pyramids of changed or moved files are left behind, so the cache is
+    bounded by maxBytes: the modification time of cache files is updated
+    when they are loaded, and the oldest ones are removed first.
+    '''
+    def __init__(self, cacheDir, maxBytes=defaultPeakCacheSize * 1048576):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        #total size of the cache files, computed on the first store
+        self.currentBytes = None
+        self.lock = Lock()
+
+    def cachePath(self, filePath):
+        try:
+            stat = os.stat(filePath)
+        except OSError:
+            return None
+        key = '{}\0{}\0{}'.format(filePath, stat.st_mtime_ns, stat.st_size)
+        return os.path.join(self.cacheDir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.npz')
+
+    def load(self, filePath):
+        cachePath = self.cachePath(filePath)
+        if not cachePath or not os.path.exists(cachePath):
+            return None
+        try:
+            #all levels are read here, in the loading thread, so that views
+            #never read the cache file, which might be pruned meanwhile
+            with np.load(cachePath) as data:
+                frames, channels = data['shape']
+                blockSizes = data['blockSizes']
+                levels = {index: data['level{}'.format(index)] for index in range(len(blockSizes))}
+        except Exception as e:
+            print(e)
+            return None
+        try:
+            os.utime(cachePath)
+        except OSError:
+            pass
+        return Peaks(int(frames), int(channels), blockSizes, levels)
+
+    def store(self, filePath, peaks):
+        cachePath = self.cachePath(filePath)
+        if not cachePath:
+            return False
+        arrays = {'level{}'.format(index): peaks.level(index) for index in range(len(peaks.blockSizes))}
+        tempPath = '{}.{}.tmp'.format(cachePath, get_ident())
+        try:
+            if not os.path.isdir(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            with open(tempPath, 'wb') as cacheFile:
+                np.savez(cacheFile, shape=np.array((peaks.frames, peaks.channels)), blockSizes=np.array(peaks.blockSizes), **arrays)
+            os.replace(tempPath, cachePath)
+            size = os.path.getsize(cachePath)
+        except Exception as e:
+            print(e)
+            return False
+        with self.lock:
+            if self.currentBytes is None:
+                self.currentBytes = self.cacheSize()
+            else:
+                self.currentBytes += size
+            if self.currentBytes > self.maxBytes:
+                self._prune()
+        return True
+
+    def cacheSize(self):
+        try:
+            with os.scandir(self.cacheDir) as it:
+                return sum(entry.stat().st_size for entry in it if entry.name.endswith('.npz'))
+        except OSError:
+            return 0
+
+    def setMaxBytes(self, maxBytes):
+        with self.lock:
+            self.maxBytes = maxBytes
+            if self.currentBytes is not None and self.currentBytes > self.maxBytes:
+                self._prune()
+
+    def _prune(self):
+        try:
+            with os.scandir(self.cacheDir) as it:
+                files = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in it if entry.name.endswith('.npz')]
+        except OSError as e:
+            print(e)
+            return
+        files.sort()
+        self.currentBytes = sum(size for mtime, size, path in files)
+        target = self.maxBytes * pruneRatio
+        for mtime, size, path in files:
+            if self.currentBytes <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.currentBytes -= size
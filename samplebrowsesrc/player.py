@@ -1,74 +1,139 @@
-import samplerate
+import numpy as np
 from PyQt5 import QtCore, QtMultimedia
 
+from samplebrowsesrc.decoder import ResampledStream
+from samplebrowsesrc.constants import downmixLayouts
+
+#milliseconds of silence given to the output at each read while waiting for
+#the stream that continues a preview
+waitSilence = 10
+
+
+def downmixMatrix(channels):
+    '''
+    Return the (channels, 2) matrix that converts a block to stereo, or None
+    for stereo files.
+    '''
+    if channels == 2:
+        return None
+    #unknown layouts are mixed to mono
+    layout = downmixLayouts.get(channels, 'M' * channels)
+    #side channels are scaled so that the overall level stays the same as
+    #the previous per-layout mixing
+    sideGain = 1. / (layout.count('L') + layout.count('M') / 2)
+    matrix = np.zeros((channels, 2), dtype='float32')
+    for channel, dest in enumerate(layout):
+        if dest == 'L':
+            matrix[channel, 0] = sideGain
+        elif dest == 'R':
+            matrix[channel, 1] = sideGain
+        else:
+            matrix[channel] = .5
+    return matrix
+
 
 class WaveIODevice(QtCore.QIODevice):
     def __init__(self, parent):
         QtCore.QIODevice.__init__(self, parent)
-        self.waveData = None
-        self.byteArray = QtCore.QByteArray()
+        self.waveStream = None
+        self.downmix = None
+        self.blocks = iter(())
+        self.buffer = memoryview(b'')
         self.bytePos = 0
+        self.bufferFrame = 0
+        self.bufferFrames = 0
+        self.waiting = False
 
     def stop(self):
+        self.waiting = False
+        self.closeBlocks()
+        self.buffer = memoryview(b'')
         self.bytePos = 0
         self.close()
 
-    def setWaveData(self, waveData, info):
-        if info.samplerate != self.parent().sampleRate:
-            #ratio is output/input
-            waveData = samplerate.resample(waveData, self.parent().sampleRate / info.samplerate, self.parent().sampleRateConversion)
+    def closeBlocks(self):
+        #closing the generator also closes the underlying sound file
+        if hasattr(self.blocks, 'close'):
+            self.blocks.close()
+        self.blocks = iter(())
+
+    def setWaveStream(self, waveStream, info, waiting=False):
+        #if waiting is set, silence is played at the end of the stream until
+        #switchStream is called, so that the output does not go idle
+        self.waiting = waiting
+        self.setStream(waveStream)
+        self.startBlocks(0)
+        self.open(QtCore.QIODevice.ReadOnly)
 
-        if info.channels == 1:
-            waveData = waveData.repeat(2, axis=1)/2
-        elif info.channels == 2:
-            pass
-        elif info.channels == 3:
-            front = waveData[:, [0, 1]]/1.5
-            center = waveData[:, [2]].repeat(2, axis=1)/2
-            waveData = front + center
-        elif info.channels == 4:
-            front = waveData[:, [0, 1]]/2
-            rear = waveData[:, [2, 3]]/2
-            waveData = front + rear
-        elif info.channels == 5:
-            front = waveData[:, [0, 1]]/2.5
-            rear = waveData[:, [2, 3]]/2.5
-            center = waveData[:, [4]].repeat(2, axis=1)/2
-            waveData = front + rear + center
-        elif info.channels == 6:
-            front = waveData[:, [0, 1]]/3
-            rear = waveData[:, [2, 3]]/3
-            center = waveData[:, [4]].repeat(2, axis=1)/2
-            sub = waveData[:, [5]].repeate(2, axis=1)/2
-            waveData = front + rear + center + sub
+    def setStream(self, waveStream):
+        #streams coming from the audio cache are usually already resampled,
+        #the others are converted while they are played
+        if waveStream.samplerate != self.parent().sampleRate:
+            waveStream = ResampledStream(waveStream, self.parent().sampleRate, self.parent().sampleRateConversion)
+        self.waveStream = waveStream
+        self.downmix = downmixMatrix(waveStream.channels)
+
+    def switchStream(self, waveStream):
+        #continue playing from the same frame with another stream of the
+        #same file, used to replace previews with the actual file contents
+        frame = self.currentFrame()
+        self.waiting = False
+        self.setStream(waveStream)
+        self.startBlocks(frame)
+
+    def currentFrame(self):
+        if not self.bufferFrames:
+            return self.bufferFrame
+        return self.bufferFrame + self.bytePos * self.bufferFrames // len(self.buffer)
+
+    def startBlocks(self, frame):
+        self.closeBlocks()
+        self.blocks = self.waveStream.blocks(frame)
+        self.buffer = memoryview(b'')
+        self.bytePos = 0
+        self.bufferFrame = frame
+        self.bufferFrames = 0
+
+    def convert(self, waveData):
+        if self.downmix is not None:
+            waveData = waveData.dot(self.downmix)
         if self.parent().sampleSize == 16:
             waveData = (waveData * 32767).astype('int16')
-        self.waveData = waveData
-        self.byteArray.clear()
-        self.byteArray.append(waveData.tostring())
-        self.open(QtCore.QIODevice.ReadOnly)
-#        self.byteArray.seek(0)
+        return waveData
 
     def seekPos(self, pos):
-        self.bytePos = int(self.byteArray.size() * pos) // self.parent().sampleSize * self.parent().sampleSize
-#        print(pos, self.byteArray.size())
+        self.startBlocks(int(self.waveStream.frames * pos))
 
     def readData(self, maxlen):
-        if self.bytePos > self.byteArray.size():
-            return None
-
-        data = QtCore.QByteArray()
+        #slices are views of the converted block, the only copy is the
+        #bytes object returned to Qt
+        chunks = []
         total = 0
 
-#        print(self.bytePos)
-        while maxlen > total and self.bytePos < self.byteArray.size():
-            chunk = min(self.byteArray.size() - self.bytePos, maxlen - total)
-            data.append(self.byteArray.mid(self.bytePos, chunk))
-#            self.bytePos = (self.bytePos + chunk) % self.byteArray.size()
+        while maxlen > total:
+            if self.bytePos >= len(self.buffer):
+                #decode and convert the next block only when the output needs it
+                try:
+                    block = next(self.blocks)
+                except StopIteration:
+                    if self.waiting and not total:
+                        #silence does not move the current frame
+                        frameSize = 2 * self.parent().sampleSize // 8
+                        frames = self.parent().sampleRate * waitSilence // 1000
+                        return bytes(min(maxlen // frameSize, frames) * frameSize)
+                    break
+                self.buffer = memoryview(np.ascontiguousarray(self.convert(block))).cast('B')
+                self.bytePos = 0
+                self.bufferFrame += self.bufferFrames
+                self.bufferFrames = len(block)
+            chunk = min(len(self.buffer) - self.bytePos, maxlen - total)
+            chunks.append(self.buffer[self.bytePos:self.bytePos + chunk])
             self.bytePos += chunk
             total += chunk
 
-        return data.data()
+        if len(chunks) == 1:
+            return chunks[0].tobytes()
+        return b''.join(chunks)
 
 
 class Player(QtCore.QObject):
@@ -163,11 +228,14 @@ class Player(QtCore.QObject):
         self.output.stop()
         self.waveIODevice.stop()
 
-    def play(self, waveData, info):
-        self.waveIODevice.setWaveData(waveData, info)
+    def play(self, waveStream, info, waiting=False):
+        self.waveIODevice.setWaveStream(waveStream, info, waiting)
 #        self.output.start(self.audioBufferArray)
         self.output.start(self.waveIODevice)
 
+    def switchStream(self, waveStream):
+        self.waveIODevice.switchStream(waveStream)
+
     def setVolume(self, volume):
 #        try:
 #            volume = QtMultimedia.QAudio.convertVolume(volume / 100, QtMultimedia.QAudio.LogarithmicVolumeScale, QtMultimedia.QAudio.LinearVolumeScale)
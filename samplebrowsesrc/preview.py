@@ -0,0 +1,143 @@
+import sqlite3
+from io import BytesIO
+from collections import namedtuple
+import numpy as np
+from PyQt5 import QtCore
+
+from samplebrowsesrc.decoder import WaveStream, ArrayStream, ResampledStream
+from samplebrowsesrc.peakcache import Peaks
+from samplebrowsesrc.probe import sampleInfo
+
+#seconds of audio stored in previews
+previewLength = 2
+#only the pyramid levels coarser than this are stored
+previewMaxBlocks = 2048
+#previews are sent to the database in groups
+previewBatchSize = 50
+
+PreviewInfo = namedtuple('PreviewInfo', 'frames samplerate channels format subtype')
+
+
+class Preview(object):
+    '''
+    Compact representation of a sample stored in the database: file info,
+    the coarse levels of its peak pyramid and the first seconds of audio at
+    the output device rate, so that it can be drawn and played before the
+    file itself is read.
+    '''
+    def __init__(self, info, peaks, audio, audioRate):
+        self.info = info
+        self.peaks = peaks
+        self.audio = audio
+        self.audioRate = audioRate
+
+    @classmethod
+    def fromFile(cls, filePath, sampleRate, conversion='sinc_fastest', stop=None, peakCache=None):
+        #the file is only decoded whole if its peaks are not cached yet
+        info = sampleInfo(filePath)
+        waveStream = WaveStream(filePath)
+        peaks = peakCache.load(filePath) if peakCache is not None else None
+        if peaks is None:
+            peaks = Peaks.fromStream(waveStream, stop)
+            if peaks is None:
+                return None
+            if peakCache is not None:
+                peakCache.store(filePath, peaks)
+        audioStream = waveStream
+        if waveStream.samplerate != sampleRate:
+            audioStream = ResampledStream(waveStream, sampleRate, conversion)
+        audioFrames = previewLength * sampleRate
+        blocks = []
+        frames = 0
+        for block in audioStream.blocks():
+            blocks.append(block[:audioFrames - frames])
+            frames += len(blocks[-1])
+            if frames >= audioFrames:
+                break
+        if blocks:
+            audio = np.concatenate(blocks)
+        else:
+            audio = np.zeros((0, info.channels), dtype='float32')
+        audio = (np.clip(audio, -1, 1) * 32767).astype('int16')
+        return cls(PreviewInfo(info.frames, info.samplerate, info.channels, info.format, info.subtype), peaks, audio, sampleRate)
+
+    @classmethod
+    def fromBlob(cls, blob):
+        with np.load(BytesIO(blob)) as data:
+            frames, samplerate, channels, audioRate = data['shape']
+            format, subtype = data['format']
+            blockSizes = data['blockSizes']
+            levels = {index: data['level{}'.format(index)] for index in range(len(blockSizes))}
+            audio = data['audio']
+        info = PreviewInfo(int(frames), int(samplerate), int(channels), str(format), str(subtype))
+        return cls(info, Peaks(info.frames, info.channels, blockSizes, levels), audio, int(audioRate))
+
+    def toBlob(self):
+        first = 0
+        for index, blockSize in enumerate(self.peaks.blockSizes):
+            first = index
+            if self.peaks.level(index).shape[1] <= previewMaxBlocks:
+                break
+        blockSizes = self.peaks.blockSizes[first:]
+        levels = {'level{}'.format(index): self.peaks.level(first + index) for index in range(len(blockSizes))}
+        blob = BytesIO()
+        np.savez_compressed(blob,
+            shape=np.array((self.info.frames, self.info.samplerate, self.info.channels, self.audioRate)),
+            format=np.array((self.info.format, self.info.subtype)),
+            blockSizes=np.array(blockSizes),
+            audio=self.audio,
+            **levels)
+        return blob.getvalue()
+
+    def stream(self):
+        return ArrayStream(self.audio.astype('float32') / 32767, self.audioRate)
+
+
+def readPreview(dbPath, filePath):
+    '''
+    Read the preview of a sample from the database at dbPath, with its own
+    connection so that it can be used from any thread; returns None if the
+    sample has no preview.
+    '''
+    db = sqlite3.connect(dbPath)
+    try:
+        res = db.execute('SELECT preview FROM samples WHERE filePath=?', (filePath, )).fetchone()
+    finally:
+        db.close()
+    if not res or not res[0]:
+        return None
+    return Preview.fromBlob(res[0])
+
+
+class PreviewBuilderSignals(QtCore.QObject):
+    built = QtCore.pyqtSignal(object)
+
+
+class PreviewBuilder(QtCore.QRunnable):
+    def __init__(self, filePaths, sampleRate, conversion, stop, peakCache=None):
+        QtCore.QRunnable.__init__(self)
+        self.filePaths = filePaths
+        self.sampleRate = sampleRate
+        self.conversion = conversion
+        self.stop = stop
+        self.peakCache = peakCache
+        self.signals = PreviewBuilderSignals()
+
+    def run(self):
+        previews = []
+        for filePath in self.filePaths:
+            if self.stop.is_set():
+                return
+            try:
+                preview = Preview.fromFile(filePath, self.sampleRate, self.conversion, self.stop, self.peakCache)
+                if preview is None:
+                    return
+                previews.append((filePath, preview.toBlob()))
+            except Exception as e:
+                print(e)
+                continue
+            if len(previews) >= previewBatchSize:
+                self.signals.built.emit(previews)
+                previews = []
+        if previews:
+            self.signals.built.emit(previews)
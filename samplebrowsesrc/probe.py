@@ -0,0 +1,204 @@
+import os
+import struct
+from collections import namedtuple
+import soundfile
+
+#bytes read from the start of the file; headers whose audio data starts
+#later are left to soundfile
+probeHeaderSize = 4096
+
+SampleInfo = namedtuple('SampleInfo', 'frames samplerate channels format subtype')
+
+#WAVE_FORMAT_* codes; 8 bit PCM is unsigned in WAV files
+wavSubtypes = {
+    (1, 8): 'PCM_U8',
+    (1, 16): 'PCM_16',
+    (1, 24): 'PCM_24',
+    (1, 32): 'PCM_32',
+    (3, 32): 'FLOAT',
+    (3, 64): 'DOUBLE',
+    (6, 8): 'ALAW',
+    (7, 8): 'ULAW',
+    }
+wavExtensible = 0xfffe
+
+#AIFC compression types, None for big endian PCM
+aiffCompressions = {
+    b'NONE': None,
+    b'twos': None,
+    b'sowt': None,
+    b'raw ': 'PCM_U8',
+    b'fl32': 'FLOAT',
+    b'FL32': 'FLOAT',
+    b'fl64': 'DOUBLE',
+    b'FL64': 'DOUBLE',
+    b'ulaw': 'ULAW',
+    b'ULAW': 'ULAW',
+    b'alaw': 'ALAW',
+    b'ALAW': 'ALAW',
+    }
+aiffSubtypes = {
+    8: 'PCM_S8',
+    16: 'PCM_16',
+    24: 'PCM_24',
+    32: 'PCM_32',
+    }
+flacSubtypes = {
+    8: 'PCM_S8',
+    16: 'PCM_16',
+    24: 'PCM_24',
+    }
+
+
+def readHeader(filePath):
+    #the first bytes of the file and its size, with a single read
+    fd = os.open(filePath, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        fileSize = os.fstat(fd).st_size
+        if hasattr(os, 'pread'):
+            return os.pread(fd, probeHeaderSize, 0), fileSize
+        return os.read(fd, probeHeaderSize), fileSize
+    finally:
+        os.close(fd)
+
+
+def chunks(header, start, byteOrder):
+    #(id, data offset, size) of the RIFF/IFF chunks contained in the header
+    pos = start
+    while pos + 8 <= len(header):
+        chunkId = header[pos:pos + 4]
+        size = struct.unpack_from(byteOrder + 'I', header, pos + 4)[0]
+        yield chunkId, pos + 8, size
+        pos += 8 + size + (size & 1)
+
+
+def parseWav(header, fileSize):
+    if len(header) < 12 or header[8:12] != b'WAVE':
+        return None
+    fmt = None
+    for chunkId, offset, size in chunks(header, 12, '<'):
+        if chunkId == b'fmt ':
+            if size < 16 or offset + size > len(header):
+                return None
+            fmt = struct.unpack_from('<HHIIHH', header, offset)
+            tag, channels, samplerate, byteRate, blockAlign, bits = fmt
+            format = 'WAV'
+            if tag == wavExtensible:
+                if size < 40:
+                    return None
+                #the format code is at the start of the subformat GUID
+                tag = struct.unpack_from('<H', header, offset + 24)[0]
+                format = 'WAVEX'
+        elif chunkId == b'data':
+            if fmt is None or size in (0, 0xffffffff):
+                return None
+            subtype = wavSubtypes.get((tag, bits))
+            if subtype is None or not channels or blockAlign != channels * bits // 8:
+                return None
+            #files that were not completely written have a wrong data size
+            size = min(size, fileSize - offset)
+            return SampleInfo(size // blockAlign, samplerate, channels, format, subtype)
+    return None
+
+
+def extendedFloat(data):
+    #80 bit IEEE 754 extended precision, as used by AIFF sample rates
+    exponent, mantissa = struct.unpack('>HQ', data)
+    if not mantissa:
+        return 0
+    sign = -1 if exponent & 0x8000 else 1
+    return sign * mantissa * 2. ** ((exponent & 0x7fff) - 16383 - 63)
+
+
+def parseAiff(header, fileSize):
+    if len(header) < 12 or header[8:12] not in (b'AIFF', b'AIFC'):
+        return None
+    comm = None
+    for chunkId, offset, size in chunks(header, 12, '>'):
+        if chunkId == b'COMM':
+            if size < 18 or offset + size > len(header):
+                return None
+            channels, frames, bits = struct.unpack_from('>HIH', header, offset)
+            samplerate = int(extendedFloat(header[offset + 8:offset + 18]))
+            compression = None
+            if header[8:12] == b'AIFC':
+                if size < 22:
+                    return None
+                try:
+                    compression = aiffCompressions[header[offset + 18:offset + 22]]
+                except KeyError:
+                    return None
+            if compression is None:
+                subtype = aiffSubtypes.get(bits)
+                blockAlign = channels * bits // 8
+            else:
+                subtype = compression
+                blockAlign = channels * (1 if compression in ('PCM_U8', 'ULAW', 'ALAW') else bits // 8)
+            comm = frames, samplerate, channels, subtype, blockAlign
+        elif chunkId == b'SSND':
+            if comm is None or offset + 8 > len(header):
+                return None
+            frames, samplerate, channels, subtype, blockAlign = comm
+            if subtype is None or not channels or not blockAlign:
+                return None
+            dataOffset = struct.unpack_from('>I', header, offset)[0]
+            start = offset + 8 + dataOffset
+            dataFrames = min(size - 8 - dataOffset, fileSize - start) // blockAlign
+            #sample frames in COMM and SSND disagree in broken files, whose
+            #actual length depends on how they are read
+            if dataFrames != frames:
+                return None
+            return SampleInfo(frames, samplerate, channels, 'AIFF', subtype)
+    return None
+
+
+def parseFlac(header, fileSize):
+    #STREAMINFO is always the first metadata block
+    if len(header) < 42 or header[4] & 0x7f != 0:
+        return None
+    packed = struct.unpack_from('>Q', header, 18)[0]
+    samplerate = packed >> 44
+    channels = ((packed >> 41) & 7) + 1
+    bits = ((packed >> 36) & 31) + 1
+    frames = packed & 0xfffffffff
+    subtype = flacSubtypes.get(bits)
+    #the length of streams is not always known
+    if not frames or not samplerate or subtype is None:
+        return None
+    #files must have some audio after the metadata blocks
+    pos = 4
+    while pos + 4 <= len(header):
+        last = header[pos] & 0x80
+        pos += 4 + (struct.unpack_from('>I', header, pos)[0] & 0xffffff)
+        if last:
+            if fileSize <= pos:
+                return None
+            break
+    return SampleInfo(frames, samplerate, channels, 'FLAC', subtype)
+
+
+headerParsers = {
+    b'RIFF': parseWav,
+    b'FORM': parseAiff,
+    b'fLaC': parseFlac,
+    }
+
+
+def sampleInfo(filePath):
+    '''
+    Return the info of a sample as soundfile.info does, with the same
+    frames, samplerate, channels, format and subtype attributes. The
+    headers of common WAV, AIFF and FLAC files are parsed directly from
+    their first bytes, without opening them through libsndfile; anything
+    else is left to soundfile, which raises if the file is not valid.
+    '''
+    try:
+        header, fileSize = readHeader(filePath)
+        parser = headerParsers.get(header[:4])
+        if parser is not None:
+            info = parser(header, fileSize)
+            if info is not None:
+                return info
+    except (OSError, struct.error):
+        pass
+    return soundfile.info(filePath)
@@ -4,6 +4,73 @@ from PyQt5 import QtCore, QtGui
 
 from samplebrowsesrc.constants import *
 
+
+def splitTags(tags):
+    if not tags:
+        return []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    return [tag.strip() for tag in tags if tag.strip()]
+
+
+#sample view columns that can be filtered, and their database fields
+filterFields = {
+    fileNameColumn: 'fileName', 
+    lengthColumn: 'length', 
+    formatColumn: 'format', 
+    rateColumn: 'sampleRate', 
+    channelsColumn: 'channels', 
+    }
+
+samplesColumns = 'filePath varchar primary key, fileName varchar, length float, format varchar, sampleRate int, channels int, subtype varchar, tags varchar, preview blob, fileSize int, mtime int, inode int'
+
+#file name searches shorter than this cannot use the trigram index
+nameIndexMinLength = 3
+nameMatch = 'sample_names MATCH ?'
+
+
+def queryFingerprints(cursor, dirPath, recursive=True):
+    '''
+    Return a dict of the fingerprints (as in utils.fileFingerprint) of the
+    samples in dirPath, and in its subdirectories if recursive is set.
+    '''
+    #range on the primary key, '0' is the character that follows '/'
+    query = 'SELECT filePath, fileSize, mtime, inode FROM samples WHERE filePath>=? AND filePath<?'
+    params = dirPath + '/', dirPath + '0'
+    if not recursive:
+        query += ' AND instr(substr(filePath, ?), \'/\')=0'
+        params += (len(dirPath) + 2, )
+    cursor.execute(query, params)
+    return {filePath: (fileSize, mtime, inode) for filePath, fileSize, mtime, inode in cursor.fetchall()}
+
+
+def queryPage(cursor, condition, params, lastRowId, limit):
+    '''
+    Return up to limit rows of rowid and sampleViewFields matching
+    condition, ordered by rowid and following lastRowId (if not None).
+    '''
+    tables = 'samples'
+    rowId = 'samples.rowid'
+    if nameMatch in condition:
+        #the name index returns rowids in order, so it is scanned first and
+        #stops as soon as the page is full
+        tables = 'sample_names CROSS JOIN samples ON samples.rowid=sample_names.rowid'
+        rowId = 'sample_names.rowid'
+    conditions = []
+    args = []
+    if lastRowId is not None:
+        conditions.append('{}>?'.format(rowId))
+        args.append(lastRowId)
+    if condition:
+        conditions.append('({})'.format(condition))
+        args.extend(params)
+    cursor.execute(
+        'SELECT samples.rowid, {} FROM {} {} ORDER BY {} LIMIT ?'.format(
+            sampleViewFields, tables, 'WHERE ' + ' AND '.join(conditions) if conditions else '', rowId), 
+        args + [limit])
+    return cursor.fetchall()
+
+
 class SampleDb(QtCore.QObject):
     backupDone = QtCore.pyqtSignal(bool)
     def __init__(self, parent):
@@ -13,6 +80,7 @@ class SampleDb(QtCore.QObject):
         self.dbConn = None
         self.dbCursor = None
         self.initialized = False
+        self.nameIndex = False
         self.tagColorsDict = {}
         self.settings = QtCore.QSettings()
         self.dbBackupTimer = QtCore.QTimer()
@@ -95,7 +163,8 @@ class SampleDb(QtCore.QObject):
                 dbCursor.execute('SELECT name FROM sqlite_master WHERE type="table"')
                 tables = [table[0] for table in dbCursor.fetchall()]
                 #check that we don't have foreign tables in here
-                base = set(('samples', 'tagColors'))
+                base = set(('samples', 'tagColors', 'tags', 'sample_tags'))
+                base.update('sample_names' + suffix for suffix in ('', '_data', '_idx', '_docsize', '_config'))
                 assert not (set(tables) | base) ^ base
                 assert self.initialize(dbFile, dbConn)
             except Exception as e:
@@ -113,22 +182,61 @@ class SampleDb(QtCore.QObject):
         return self.initialize(dbFile)
 
     def createTables(self, dbCursor):
+        rebuildTags = False
         if not dbCursor.execute('SELECT name FROM sqlite_master WHERE type="table" AND name="samples"').fetchone():
             try:
-                dbCursor.execute('CREATE table samples(filePath varchar primary key, fileName varchar, length float, format varchar, sampleRate int, channels int, tags varchar, preview blob)')
+                dbCursor.execute('CREATE table samples({})'.format(samplesColumns))
             except Exception as e:
                 print(e)
                 return False
         #migrate from _very_ early version (someday we will remove this
-        elif len(dbCursor.execute('PRAGMA table_info(samples)').fetchall()) != len(allColumns):
+        elif [field[1] for field in dbCursor.execute('PRAGMA table_info(samples)').fetchall()] == dbFieldsOld:
             try:
                 dbCursor.execute('ALTER TABLE samples RENAME TO oldsamples')
-                dbCursor.execute('CREATE table samples(filePath varchar primary key, fileName varchar, length float, format varchar, sampleRate int, channels int, subtype varchar, tags varchar, preview blob)')
+                dbCursor.execute('CREATE table samples({})'.format(samplesColumns))
                 dbCursor.execute('INSERT INTO samples (filePath, fileName, length, format, sampleRate, channels, tags, preview) SELECT filePath, fileName, length, format, sampleRate, channels, tags, preview FROM oldsamples')
                 dbCursor.execute('DROP TABLE oldsamples')
+                #rowids have changed
+                rebuildTags = True
+            except Exception as e:
+                print(e)
+                return False
+        fields = [field[1] for field in dbCursor.execute('PRAGMA table_info(samples)').fetchall()]
+        try:
+            for field in fingerprintFields:
+                if field not in fields:
+                    dbCursor.execute('ALTER TABLE samples ADD COLUMN {} int'.format(field))
+        except Exception as e:
+            print(e)
+            return False
+        #tags are stored in their own table and linked to samples rowids;
+        #samples.tags is kept as a denormalized copy for display
+        if not dbCursor.execute('SELECT name FROM sqlite_master WHERE type="table" AND name="tags"').fetchone():
+            try:
+                dbCursor.execute('CREATE table tags(id integer primary key, path varchar unique not null)')
+                dbCursor.execute('CREATE table sample_tags(sample_id integer not null, tag_id integer not null, primary key(sample_id, tag_id))')
+                dbCursor.execute('CREATE INDEX sample_tags_tag ON sample_tags(tag_id, sample_id)')
+                dbCursor.execute('CREATE TRIGGER samples_delete AFTER DELETE ON samples BEGIN DELETE FROM sample_tags WHERE sample_id=old.rowid; END')
+                rebuildTags = True
             except Exception as e:
                 print(e)
                 return False
+        if rebuildTags:
+            try:
+                dbCursor.execute('DELETE FROM sample_tags')
+                for sampleId, tags in dbCursor.execute('SELECT rowid, tags FROM samples').fetchall():
+                    self._linkTags(dbCursor, sampleId, splitTags(tags))
+            except Exception as e:
+                print(e)
+                return False
+        self.nameIndex = self.createNameIndex(dbCursor, rebuildTags)
+        #indexes for the sample view filters
+        try:
+            for field in ('format', 'sampleRate', 'channels', 'length'):
+                dbCursor.execute('CREATE INDEX IF NOT EXISTS samples_{field} ON samples({field})'.format(field=field))
+        except Exception as e:
+            print(e)
+            return False
         if not dbCursor.execute('SELECT name FROM sqlite_master WHERE type="table" AND name="tagColors"').fetchone():
             try:
                 dbCursor.execute('CREATE table tagColors(tag varchar primary key, foreground varchar, background varchar)')
@@ -137,6 +245,34 @@ class SampleDb(QtCore.QObject):
                 return False
         return True
 
+    def createNameIndex(self, dbCursor, rebuild=False):
+        '''
+        Create the fts5 trigram index used for file name searches if it does
+        not exist yet; returns False if sqlite does not support it.
+        '''
+        #the index keeps no copy of the names, they are read from samples
+        try:
+            if not dbCursor.execute('SELECT name FROM sqlite_master WHERE type="table" AND name="sample_names"').fetchone():
+                dbCursor.execute("CREATE VIRTUAL TABLE sample_names USING fts5(fileName, content='samples', content_rowid='rowid', tokenize='trigram')")
+                rebuild = True
+            #triggers are dropped along with the old table when samples is migrated
+            dbCursor.execute(
+                'CREATE TRIGGER IF NOT EXISTS sample_names_insert AFTER INSERT ON samples BEGIN '\
+                'INSERT INTO sample_names(rowid, fileName) VALUES (new.rowid, new.fileName); END')
+            dbCursor.execute(
+                'CREATE TRIGGER IF NOT EXISTS sample_names_delete AFTER DELETE ON samples BEGIN '\
+                "INSERT INTO sample_names(sample_names, rowid, fileName) VALUES ('delete', old.rowid, old.fileName); END")
+            dbCursor.execute(
+                'CREATE TRIGGER IF NOT EXISTS sample_names_update AFTER UPDATE OF fileName ON samples BEGIN '\
+                "INSERT INTO sample_names(sample_names, rowid, fileName) VALUES ('delete', old.rowid, old.fileName); "\
+                'INSERT INTO sample_names(rowid, fileName) VALUES (new.rowid, new.fileName); END')
+            if rebuild:
+                dbCursor.execute("INSERT INTO sample_names(sample_names) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            print(e)
+            return False
+        return True
+
     def execute(self, *args, **kwargs):
         self.lock.acquire()
         try:
@@ -144,3 +280,274 @@ class SampleDb(QtCore.QObject):
         finally:
             self.lock.release()
 
+    def _linkTags(self, dbCursor, sampleId, tags):
+        for tag in tags:
+            dbCursor.execute('INSERT OR IGNORE INTO tags(path) VALUES (?)', (tag, ))
+            dbCursor.execute(
+                'INSERT OR IGNORE INTO sample_tags(sample_id, tag_id) SELECT ?, id FROM tags WHERE path=?', 
+                (sampleId, tag))
+
+    def _refreshTagStrings(self, sampleIds):
+        #update the denormalized samples.tags column and return the new tags
+        res = []
+        for sampleId in sampleIds:
+            self.dbCursor.execute(
+                'SELECT path FROM tags JOIN sample_tags ON tag_id=id WHERE sample_id=? ORDER BY path', 
+                (sampleId, ))
+            tags = [tag[0] for tag in self.dbCursor.fetchall()]
+            self.dbCursor.execute('UPDATE samples SET tags=? WHERE rowid=?', (','.join(tags), sampleId))
+            self.dbCursor.execute('SELECT filePath FROM samples WHERE rowid=?', (sampleId, ))
+            res.append((self.dbCursor.fetchone()[0], tags))
+        return res
+
+    def _tagIds(self, tag):
+        #the tag and its children, using the path index instead of LIKE
+        self.dbCursor.execute(
+            'SELECT id, path FROM tags WHERE path=? OR (path>=? AND path<?)', 
+            (tag, tag + '/', tag + '0'))
+        return self.dbCursor.fetchall()
+
+    def _taggedSampleIds(self, tagIds):
+        sampleIds = set()
+        for tagId in tagIds:
+            self.dbCursor.execute('SELECT sample_id FROM sample_tags WHERE tag_id=?', (tagId, ))
+            sampleIds.update(sampleId[0] for sampleId in self.dbCursor.fetchall())
+        return sampleIds
+
+    def addSample(self, filePath, fileName, length, format, sampleRate, channels, subtype, tags, preview=None, fingerprint=None):
+        '''
+        Add or update a sample, returns its previous tags (None if it was not
+        in the database) and the new ones.
+        '''
+        oldTags = self.sampleTags(filePath)
+        fileSize, mtime, inode = fingerprint if fingerprint else (None, None, None)
+        #update existing entries in place, so that their rowid (used by
+        #sample_tags) does not change
+        self.lock.acquire()
+        try:
+            self.dbCursor.execute(
+                'UPDATE samples SET fileName=?, length=?, format=?, sampleRate=?, channels=?, subtype=?, preview=?, fileSize=?, mtime=?, inode=? WHERE filePath=?', 
+                (fileName, length, format, sampleRate, channels, subtype, preview, fileSize, mtime, inode, filePath))
+            if not self.dbCursor.rowcount:
+                oldTags = None
+                self.dbCursor.execute(
+                    'INSERT INTO samples(filePath, fileName, length, format, sampleRate, channels, subtype, tags, preview, fileSize, mtime, inode) VALUES (?,?,?,?,?,?,?,?,?,?,?,?)', 
+                    (filePath, fileName, length, format, sampleRate, channels, subtype, '', preview, fileSize, mtime, inode))
+        finally:
+            self.lock.release()
+        return oldTags, self.setSampleTags(filePath, splitTags(tags))
+
+    def fingerprints(self, dirPaths):
+        '''
+        Return a dict of the fingerprints (as in utils.fileFingerprint) of the
+        samples in dirPaths and their subdirectories.
+        '''
+        if isinstance(dirPaths, str):
+            dirPaths = [dirPaths]
+        res = {}
+        self.lock.acquire()
+        try:
+            for dirPath in dirPaths:
+                res.update(queryFingerprints(self.dbCursor, QtCore.QDir(dirPath).absolutePath().rstrip('/')))
+        finally:
+            self.lock.release()
+        return res
+
+    def updateSampleFile(self, filePath, fingerprint, length=None, format=None, sampleRate=None, channels=None, subtype=None):
+        #file info is only updated if given, and the preview is cleared then
+        self.lock.acquire()
+        try:
+            if length is None:
+                self.dbCursor.execute(
+                    'UPDATE samples SET fileSize=?, mtime=?, inode=? WHERE filePath=?',
+                    tuple(fingerprint) + (filePath, ))
+            else:
+                self.dbCursor.execute(
+                    'UPDATE samples SET length=?, format=?, sampleRate=?, channels=?, subtype=?, preview=NULL, fileSize=?, mtime=?, inode=? WHERE filePath=?',
+                    (length, format, sampleRate, channels, subtype) + tuple(fingerprint) + (filePath, ))
+        finally:
+            self.lock.release()
+
+    def moveSample(self, filePath, newPath, fingerprint):
+        #the rowid is kept, and so are the sample tags
+        self.lock.acquire()
+        try:
+            self.dbCursor.execute(
+                'UPDATE samples SET filePath=?, fileName=?, fileSize=?, mtime=?, inode=? WHERE filePath=?',
+                (newPath, newPath.rpartition('/')[2]) + tuple(fingerprint) + (filePath, ))
+        finally:
+            self.lock.release()
+
+    def sampleTags(self, filePath):
+        self.lock.acquire()
+        try:
+            self.dbCursor.execute(
+                'SELECT path FROM tags JOIN sample_tags ON tag_id=id WHERE sample_id=(SELECT rowid FROM samples WHERE filePath=?) ORDER BY path', 
+                (filePath, ))
+            return [tag[0] for tag in self.dbCursor.fetchall()]
+        finally:
+            self.lock.release()
+
+    def setSampleTags(self, filePath, tags):
+        self.lock.acquire()
+        try:
+            self.dbCursor.execute('SELECT rowid FROM samples WHERE filePath=?', (filePath, ))
+            res = self.dbCursor.fetchone()
+            if not res:
+                return None
+            sampleId = res[0]
+            self.dbCursor.execute('DELETE FROM sample_tags WHERE sample_id=?', (sampleId, ))
+            self._linkTags(self.dbCursor, sampleId, set(filter(None, tags)))
+            return self._refreshTagStrings([sampleId])[0][1]
+        finally:
+            self.lock.release()
+
+    def addSampleTag(self, filePath, tag):
+        self.lock.acquire()
+        try:
+            self.dbCursor.execute('SELECT rowid FROM samples WHERE filePath=?', (filePath, ))
+            res = self.dbCursor.fetchone()
+            if not res:
+                return None
+            self._linkTags(self.dbCursor, res[0], [tag])
+            return self._refreshTagStrings([res[0]])[0][1]
+        finally:
+            self.lock.release()
+
+    def tagCounts(self):
+        '''
+        Return a dict with the number of samples for each tag path and each
+        of its parents, computed with a single aggregated query.
+        '''
+        self.lock.acquire()
+        try:
+            #map each tag to itself and all its parents, so that a sample is
+            #counted once for every path even if more of its tags share it
+            self.dbCursor.execute('CREATE TEMP TABLE IF NOT EXISTS tag_prefixes(prefix_id integer, tag_id integer, primary key(prefix_id, tag_id)) WITHOUT ROWID')
+            self.dbCursor.execute('DELETE FROM tag_prefixes')
+            prefixIds = {}
+            links = set()
+            for tagId, path in self.dbCursor.execute('SELECT id, path FROM tags').fetchall():
+                while path:
+                    links.add((prefixIds.setdefault(path, len(prefixIds)), tagId))
+                    path = path.rpartition('/')[0]
+            self.dbCursor.executemany('INSERT INTO tag_prefixes VALUES (?,?)', links)
+            self.dbCursor.execute(
+                'SELECT prefix_id, COUNT(DISTINCT sample_id) FROM tag_prefixes CROSS JOIN sample_tags USING (tag_id) GROUP BY prefix_id')
+            counts = dict(self.dbCursor.fetchall())
+        finally:
+            self.lock.release()
+        return {path: counts[prefixId] for path, prefixId in prefixIds.items() if prefixId in counts}
+
+    def tagCount(self, tag):
+        #number of samples tagged with tag or any of its children
+        self.lock.acquire()
+        try:
+            self.dbCursor.execute(
+                'SELECT COUNT(DISTINCT sample_id) FROM sample_tags WHERE tag_id IN '\
+                '(SELECT id FROM tags WHERE path=? OR (path>=? AND path<?))', 
+                (tag, tag + '/', tag + '0'))
+            return self.dbCursor.fetchone()[0]
+        finally:
+            self.lock.release()
+
+    def tagCondition(self, tag):
+        #condition on samples tagged with tag or any of its children
+        return (
+            'samples.rowid IN (SELECT sample_id FROM sample_tags WHERE tag_id IN '\
+            '(SELECT id FROM tags WHERE path=? OR (path>=? AND path<?)))', 
+            (tag, tag + '/', tag + '0'))
+
+    def filterCondition(self, filterData):
+        '''
+        Convert the (column, data) list emitted by MainFilterWidget to an SQL
+        condition on the samples table and its parameters.
+        '''
+        conditions = []
+        params = []
+        for filterColumn, data in filterData:
+            field = filterFields[filterColumn]
+            if filterColumn == fileNameColumn:
+                if data:
+                    condition, args = self.nameCondition(data)
+                    conditions.append(condition)
+                    params.extend(args)
+            elif isinstance(data, list):
+                conditions.append('{} IN ({})'.format(field, ','.join('?' for value in data)))
+                params.extend(data)
+            else:
+                if data.greater:
+                    greater, greaterEqual = data.greater
+                    conditions.append('{} {} ?'.format(field, '>=' if greaterEqual else '>'))
+                    params.append(float(greater))
+                if data.less:
+                    less, lessEqual = data.less
+                    conditions.append('{} {} ?'.format(field, '<=' if lessEqual else '<'))
+                    params.append(float(less))
+        return ' AND '.join(conditions), tuple(params)
+
+    def nameCondition(self, text):
+        '''
+        Condition on samples whose file name contains text, ignoring case.
+        '''
+        if self.nameIndex and len(text) >= nameIndexMinLength:
+            #a quoted fts5 phrase of trigrams matches any substring
+            return (
+                nameMatch, 
+                ('fileName : "{}"'.format(text.replace('"', '""')), ))
+        return (
+            "samples.fileName LIKE ? ESCAPE '\\'", 
+            ('%{}%'.format(text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')), ))
+
+    def samplePage(self, condition, params, lastRowId, limit):
+        '''
+        Return up to limit rows of rowid and sampleViewFields matching
+        condition, ordered by rowid and following lastRowId (if not None).
+        '''
+        self.lock.acquire()
+        try:
+            return queryPage(self.dbCursor, condition, params, lastRowId, limit)
+        finally:
+            self.lock.release()
+
+    def renameTag(self, oldTag, newTag):
+        '''
+        Rename oldTag and its children, merging them with existing tags if
+        required; returns the list of (filePath, tags) of changed samples.
+        '''
+        self.lock.acquire()
+        try:
+            tagIds = self._tagIds(oldTag)
+            sampleIds = self._taggedSampleIds(tagId for tagId, path in tagIds)
+            for tagId, path in tagIds:
+                newPath = newTag + path[len(oldTag):]
+                self.dbCursor.execute('SELECT id FROM tags WHERE path=?', (newPath, ))
+                existing = self.dbCursor.fetchone()
+                if existing:
+                    self.dbCursor.execute(
+                        'INSERT OR IGNORE INTO sample_tags(sample_id, tag_id) SELECT sample_id, ? FROM sample_tags WHERE tag_id=?', 
+                        (existing[0], tagId))
+                    self.dbCursor.execute('DELETE FROM sample_tags WHERE tag_id=?', (tagId, ))
+                    self.dbCursor.execute('DELETE FROM tags WHERE id=?', (tagId, ))
+                else:
+                    self.dbCursor.execute('UPDATE tags SET path=? WHERE id=?', (newPath, tagId))
+            return self._refreshTagStrings(sorted(sampleIds))
+        finally:
+            self.lock.release()
+
+    def removeTag(self, tag):
+        '''
+        Remove tag and its children from all samples; returns the list of
+        (filePath, tags) of changed samples.
+        '''
+        self.lock.acquire()
+        try:
+            tagIds = [tagId for tagId, path in self._tagIds(tag)]
+            sampleIds = self._taggedSampleIds(tagIds)
+            for tagId in tagIds:
+                self.dbCursor.execute('DELETE FROM sample_tags WHERE tag_id=?', (tagId, ))
+                self.dbCursor.execute('DELETE FROM tags WHERE id=?', (tagId, ))
+            return self._refreshTagStrings(sorted(sampleIds))
+        finally:
+            self.lock.release()
+
@@ -1,4 +1,5 @@
-from PyQt5 import QtCore, QtWidgets
+import os
+from PyQt5 import QtCore, QtGui, QtWidgets
 
 def sizeStr(size):
     if size < 1024:
@@ -24,6 +25,14 @@ def timeStr(seconds, leading=0, trailing=3, trailingAlways=False, multiple=True,
     text = '{:01.0f}:{:02.0f}:{}'.format(hours, mins, secondsLeading(secs, leading, trailing, trailingAlways))
     return text if leadingMultiple or full else text.lstrip('0').lstrip('.:')
 
+def fileFingerprint(filePath):
+    #size, modification time and inode, or None if the file does not exist
+    try:
+        stat = os.stat(filePath)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns, stat.st_ino
+
 def setBold(item, bold=True):
     try:
         font = item.font()
@@ -32,6 +41,8 @@ def setBold(item, bold=True):
     except:
         try:
             font = item.data(QtCore.Qt.FontRole)
+            if font is None:
+                font = QtGui.QFont()
             font.setBold(bold)
             item.model().setData(item, font, QtCore.Qt.FontRole)
         except:
@@ -49,6 +60,8 @@ def setItalic(item, italic=True):
     except:
         try:
             font = item.data(QtCore.Qt.FontRole)
+            if font is None:
+                font = QtGui.QFont()
             font.setItalic(italic)
             item.model().setData(item, font, QtCore.Qt.FontRole)
         except:
@@ -0,0 +1,325 @@
+import os
+import errno
+import sqlite3
+from collections import namedtuple
+from threading import Event
+from PyQt5 import QtCore
+
+from samplebrowsesrc.constants import availableFormats
+from samplebrowsesrc.classes import probeFile
+from samplebrowsesrc.sampledb import queryFingerprints
+
+#milliseconds to wait for more changes before checking a directory
+watchDelay = 500
+#milliseconds between checks of polled directories
+watchPollInterval = 10000
+
+WatchChanges = namedtuple('WatchChanges', 'created modified moved deleted entries pending unreadable')
+
+
+def isSampleName(fileName):
+    return os.path.splitext(fileName)[1][1:].lower() in availableFormats
+
+
+class WatchJobSignals(QtCore.QObject):
+    done = QtCore.pyqtSignal(object)
+
+
+class WatchJob(QtCore.QRunnable):
+    '''
+    Compares changed directories with the database at dbPath, which is read
+    with a separate connection.
+    dirs is a list of (dirPath, rootPath, entries), entries being the names
+    found in the directory by the previous check, or None if it was not
+    checked yet: in that case the directory is only listed. Only the samples
+    directly contained in the checked directories are compared, unless a
+    directory is gone or missing from the entries of its parent, as when
+    moving or removing a tree: all the samples below it are then removed.
+    Only files that appeared since the previous check are added, so that
+    samples that were not imported on purpose are left alone; files that
+    cannot be read yet (usually because they are being written) are listed
+    as pending and left out of the entries, to be checked again later.
+    Directories that exist but cannot be listed keep their previous entries
+    and are listed as unreadable.
+    '''
+    def __init__(self, dirs, dbPath, stop):
+        QtCore.QRunnable.__init__(self)
+        self.dirs = dirs
+        self.dbPath = dbPath
+        self.stop = stop
+        self.signals = WatchJobSignals()
+
+    def run(self):
+        try:
+            dbConn = sqlite3.connect(self.dbPath)
+            try:
+                changes = self.compare(dbConn.cursor())
+            finally:
+                dbConn.close()
+        except Exception as e:
+            print(e)
+            changes = WatchChanges([], [], [], [], {}, [], [])
+        if changes is not None and not self.stop.is_set():
+            self.signals.done.emit(changes)
+
+    def compare(self, cursor):
+        created = []
+        modified = []
+        deleted = []
+        entries = {}
+        pending = []
+        unreadable = []
+        knownFiles = {}
+        goneDirs = set()
+        existingRoots = {}
+        def rootExists(rootPath):
+            try:
+                return existingRoots[rootPath]
+            except KeyError:
+                existingRoots[rootPath] = os.path.isdir(rootPath)
+                return existingRoots[rootPath]
+
+        checkedFiles = {}
+        for dirPath, rootPath, oldEntries in self.dirs:
+            if self.stop.is_set():
+                return
+            try:
+                names = os.listdir(dirPath)
+            except OSError as e:
+                if not rootExists(rootPath):
+                    #unmounted drives and the like are left untouched
+                    continue
+                if e.errno != errno.ENOENT and os.path.isdir(dirPath):
+                    #permission or I/O errors: its samples are kept until the
+                    #directory can be listed again
+                    unreadable.append(dirPath)
+                    continue
+                entries[dirPath] = set()
+                if oldEntries is not None:
+                    goneDirs.add(dirPath)
+                continue
+            if oldEntries is None:
+                entries[dirPath] = set(names)
+                continue
+            dirFiles = queryFingerprints(cursor, dirPath, recursive=False)
+            checkedFiles.update(dirFiles)
+            newDirs = []
+            for name in list(names):
+                filePath = '{}/{}'.format(dirPath, name)
+                if filePath in dirFiles:
+                    continue
+                if name not in oldEntries:
+                    if isSampleName(name):
+                        if not self.probeNew(filePath, name, created, pending):
+                            names.remove(name)
+                    elif os.path.isdir(filePath) and not os.path.islink(filePath):
+                        newDirs.append(filePath)
+            entries[dirPath] = set(names)
+            #moved directories are not notified, but are missing here
+            for name in oldEntries.difference(names):
+                filePath = '{}/{}'.format(dirPath, name)
+                if filePath not in dirFiles:
+                    goneDirs.add(filePath)
+            #directories created or moved in since the previous check
+            while newDirs:
+                newDirPath = newDirs.pop()
+                try:
+                    newNames = os.listdir(newDirPath)
+                except OSError:
+                    continue
+                for name in list(newNames):
+                    filePath = '{}/{}'.format(newDirPath, name)
+                    if isSampleName(name):
+                        if not self.probeNew(filePath, name, created, pending):
+                            newNames.remove(name)
+                    elif os.path.isdir(filePath) and not os.path.islink(filePath):
+                        newDirs.append(filePath)
+                entries[newDirPath] = set(newNames)
+
+        #subtrees are queried once, from their topmost gone directory
+        for dirPath in goneDirs:
+            if any(dirPath.startswith(goneDir + '/') for goneDir in goneDirs):
+                continue
+            goneFiles = queryFingerprints(cursor, dirPath)
+            knownFiles.update(goneFiles)
+            deleted.extend(goneFiles)
+
+        knownFiles.update(checkedFiles)
+        for filePath, knownFingerprint in checkedFiles.items():
+            if self.stop.is_set():
+                return
+            dirPath, _, fileName = filePath.rpartition('/')
+            if fileName not in entries[dirPath]:
+                deleted.append(filePath)
+                continue
+            fingerprint, info = probeFile(filePath, knownFingerprint)
+            if fingerprint is None:
+                deleted.append(filePath)
+            elif fingerprint == knownFingerprint:
+                continue
+            elif knownFingerprint == (None, None, None):
+                #samples imported before fingerprints were stored
+                modified.append((filePath, None, fingerprint))
+            elif info is None:
+                pending.append(filePath)
+            else:
+                modified.append((filePath, info, fingerprint))
+
+        moved = []
+        if deleted and created:
+            #a removed sample whose file appeared elsewhere has been moved;
+            #moves across devices keep size and time, but not the inode
+            byFingerprint = {}
+            byName = {}
+            for index, (filePath, fileName, info, fingerprint) in enumerate(created):
+                byFingerprint.setdefault(fingerprint, index)
+                byName.setdefault((fileName, ) + fingerprint[:2], index)
+            movedIndexes = set()
+            for filePath in deleted:
+                knownFingerprint = knownFiles[filePath]
+                index = byFingerprint.get(knownFingerprint)
+                if index is None or index in movedIndexes:
+                    index = byName.get((filePath.rpartition('/')[2], ) + knownFingerprint[:2])
+                if index is None or index in movedIndexes:
+                    continue
+                movedIndexes.add(index)
+                newPath, fileName, info, fingerprint = created[index]
+                moved.append((filePath, newPath, fingerprint))
+            movedPaths = set(filePath for filePath, newPath, fingerprint in moved)
+            deleted = [filePath for filePath in deleted if filePath not in movedPaths]
+            created = [sample for index, sample in enumerate(created) if index not in movedIndexes]
+        return WatchChanges(created, modified, moved, deleted, entries, pending, unreadable)
+
+    def probeNew(self, filePath, fileName, created, pending):
+        fingerprint, info = probeFile(filePath)
+        if fingerprint is None:
+            return False
+        if info is None:
+            pending.append(filePath)
+            return False
+        created.append((filePath, fileName, info, fingerprint))
+        return True
+
+
+class DbWatcher(QtCore.QObject):
+    '''
+    Keeps the database in sync with the directories of its samples, as
+    listed by DbDirModel.dirPaths. Directories are watched with
+    QFileSystemWatcher, or polled every watchPollInterval if polling is set
+    or if they cannot be watched; changed directories are collected for
+    watchDelay and then checked together by a WatchJob, whose results are
+    emitted with the changed signal.
+    Notifications only come for changes to the directory contents, so files
+    rewritten in place are noticed when their directory changes again or
+    when polling. Directories that could not be listed are polled too, until
+    they can.
+    '''
+    changed = QtCore.pyqtSignal(object)
+
+    def __init__(self, sampleDb, polling=False, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.sampleDb = sampleDb
+        self.polling = polling
+        #watched directory paths and their root
+        self.dirs = {}
+        self.entries = {}
+        self.polled = set()
+        self.unreadable = set()
+        self.dirty = set()
+        self.running = False
+        self.stop = Event()
+        self.fsWatcher = QtCore.QFileSystemWatcher(self)
+        self.fsWatcher.directoryChanged.connect(self.directoryChanged)
+        self.fsWatcher.fileChanged.connect(self.fileChanged)
+        self.delayTimer = QtCore.QTimer(self)
+        self.delayTimer.setSingleShot(True)
+        self.delayTimer.setInterval(watchDelay)
+        self.delayTimer.timeout.connect(self.checkDirs)
+        self.pollTimer = QtCore.QTimer(self)
+        self.pollTimer.setInterval(watchPollInterval)
+        self.pollTimer.timeout.connect(self.poll)
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+
+    def setDirs(self, dirs):
+        '''
+        Set the directories to watch, as a dict of their paths and the root
+        directory they belong to; new directories are listed first, so that
+        only changes happening from now on are considered.
+        '''
+        removed = [dirPath for dirPath in self.dirs if dirPath not in dirs]
+        added = [dirPath for dirPath in dirs if dirPath not in self.dirs]
+        self.dirs = dict(dirs)
+        if removed:
+            watched = set(self.fsWatcher.directories())
+            watched = [dirPath for dirPath in removed if dirPath in watched]
+            if watched:
+                self.fsWatcher.removePaths(watched)
+            self.polled.difference_update(removed)
+            self.unreadable.difference_update(removed)
+            for dirPath in removed:
+                self.entries.pop(dirPath, None)
+        if added:
+            if self.polling:
+                self.polled.update(added)
+            else:
+                self.polled.update(self.fsWatcher.addPaths(added))
+            self.dirty.update(dirPath for dirPath in added if dirPath not in self.entries)
+            if not self.delayTimer.isActive():
+                self.delayTimer.start()
+        self.updatePollTimer()
+
+    def updatePollTimer(self):
+        if (self.polled or self.unreadable) and not self.pollTimer.isActive():
+            self.pollTimer.start()
+        elif not (self.polled or self.unreadable):
+            self.pollTimer.stop()
+
+    def directoryChanged(self, dirPath):
+        self.dirty.add(dirPath)
+        if not self.delayTimer.isActive():
+            self.delayTimer.start()
+
+    def fileChanged(self, filePath):
+        #pending files are watched until they can be read
+        if filePath in self.fsWatcher.files():
+            self.fsWatcher.removePath(filePath)
+        self.directoryChanged(os.path.dirname(filePath))
+
+    def poll(self):
+        self.dirty.update(self.polled)
+        self.dirty.update(self.unreadable)
+        self.checkDirs()
+
+    def checkDirs(self):
+        if self.running:
+            return
+        dirs = [(dirPath, self.dirs[dirPath], self.entries.get(dirPath)) for dirPath in sorted(self.dirty) if dirPath in self.dirs]
+        self.dirty.clear()
+        if not dirs:
+            return
+        self.running = True
+        job = WatchJob(dirs, self.sampleDb.dbFile.absoluteFilePath(), self.stop)
+        job.signals.done.connect(self.jobDone)
+        self.pool.start(job)
+
+    def jobDone(self, changes):
+        self.running = False
+        self.entries.update(changes.entries)
+        self.unreadable.difference_update(changes.entries)
+        self.unreadable.update(dirPath for dirPath in changes.unreadable if dirPath in self.dirs)
+        self.updatePollTimer()
+        if changes.pending and not self.polling:
+            self.fsWatcher.addPaths(changes.pending)
+        if changes.created or changes.modified or changes.moved or changes.deleted:
+            self.changed.emit(changes)
+        if self.dirty and not self.delayTimer.isActive():
+            self.delayTimer.start()
+
+    def close(self):
+        self.stop.set()
+        self.delayTimer.stop()
+        self.pollTimer.stop()
+        paths = self.fsWatcher.directories() + self.fsWatcher.files()
+        if paths:
+            self.fsWatcher.removePaths(paths)
@@ -0,0 +1,173 @@
+from threading import Event
+from PyQt5 import QtCore
+
+from samplebrowsesrc.decoder import openWave, fillCache
+from samplebrowsesrc.peakcache import Peaks
+from samplebrowsesrc.preview import readPreview
+
+
+def loadPeaks(filePath, peakCache, stop):
+    '''
+    Return the peaks of filePath from the cache, or compute and store them;
+    returns None if the request has been cancelled in the meantime.
+    '''
+    peaks = peakCache.load(filePath)
+    if peaks is None:
+        peaks = Peaks.fromStream(openWave(filePath), stop)
+        if peaks is None:
+            return None
+        peakCache.store(filePath, peaks)
+    return peaks
+
+
+class WaveLoadSignals(QtCore.QObject):
+    previewLoaded = QtCore.pyqtSignal(int, object)
+    loaded = QtCore.pyqtSignal(int, object)
+    peaksLoaded = QtCore.pyqtSignal(int, object)
+    failed = QtCore.pyqtSignal(int)
+
+
+class WaveLoadJob(QtCore.QRunnable):
+    def __init__(self, requestId, filePath, peakCache, draw, sampleRate, conversion, stop, previewDb=None):
+        QtCore.QRunnable.__init__(self)
+        self.requestId = requestId
+        self.filePath = filePath
+        self.previewDb = previewDb
+        self.peakCache = peakCache
+        self.draw = draw
+        self.sampleRate = sampleRate
+        self.conversion = conversion
+        self.stop = stop
+        self.signals = WaveLoadSignals()
+
+    def run(self):
+        #stale requests still queued in the pool are discarded before doing any work
+        if self.stop.is_set():
+            return
+        if self.previewDb:
+            #the database preview is delivered first, so that it can be
+            #shown and played while the file is read
+            try:
+                preview = readPreview(self.previewDb, self.filePath)
+            except Exception as e:
+                print(e)
+                preview = None
+            if preview is not None and not self.stop.is_set():
+                self.signals.previewLoaded.emit(self.requestId, preview)
+        try:
+            if self.sampleRate is not None:
+                #the playback stream is decoded (and resampled) while it is
+                #played, so it is delivered before computing the peaks
+                waveStream = openWave(self.filePath, self.sampleRate, self.conversion)
+                if self.stop.is_set():
+                    return
+                self.signals.loaded.emit(self.requestId, waveStream)
+            if not self.draw:
+                return
+            peaks = loadPeaks(self.filePath, self.peakCache, self.stop)
+            if peaks is None:
+                return
+        except Exception as e:
+            print(e)
+            if not self.stop.is_set():
+                self.signals.failed.emit(self.requestId)
+            return
+        if not self.stop.is_set():
+            self.signals.peaksLoaded.emit(self.requestId, peaks)
+
+
+class PrefetchJob(QtCore.QRunnable):
+    def __init__(self, filePaths, peakCache, sampleRate, conversion, stop):
+        QtCore.QRunnable.__init__(self)
+        self.filePaths = filePaths
+        self.peakCache = peakCache
+        self.sampleRate = sampleRate
+        self.conversion = conversion
+        self.stop = stop
+
+    def run(self):
+        for filePath in self.filePaths:
+            if self.stop.is_set():
+                return
+            try:
+                if loadPeaks(filePath, self.peakCache, self.stop) is None:
+                    return
+                #streams are only cached once they are read
+                fillCache(openWave(filePath, self.sampleRate, self.conversion))
+            except:
+                pass
+
+
+class WaveLoader(QtCore.QObject):
+    '''
+    Decodes samples and computes their waveform in a thread pool; only the
+    latest request is delivered, older ones are cancelled as soon as a new
+    one is made. If previewDb is given, the preview stored in that database
+    is read before the file and emitted with previewLoaded. When playing,
+    the stream is emitted with loaded before the peaks are computed, and
+    these are emitted with peaksLoaded.
+    Neighbouring samples can be prefetched into the audio cache with a
+    separate, single threaded pool, so that they never delay the current one.
+    '''
+    previewLoaded = QtCore.pyqtSignal(object, object, bool, bool)
+    loaded = QtCore.pyqtSignal(object, object)
+    peaksLoaded = QtCore.pyqtSignal(object, object)
+    failed = QtCore.pyqtSignal(object)
+    def __init__(self, peakCache, player, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.peakCache = peakCache
+        self.player = player
+        self.pool = QtCore.QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self.prefetchPool = QtCore.QThreadPool(self)
+        self.prefetchPool.setMaxThreadCount(1)
+        self.requestId = 0
+        self.stop = Event()
+        self.prefetchStop = Event()
+        self.filePath = None
+        self.draw = True
+        self.play = False
+
+    def load(self, filePath, draw=True, play=False, previewDb=None):
+        self.cancel()
+        self.requestId += 1
+        self.stop = Event()
+        self.filePath = filePath
+        self.draw = draw
+        self.play = play
+        sampleRate = self.player.sampleRate if play else None
+        job = WaveLoadJob(self.requestId, filePath, self.peakCache, draw, sampleRate, self.player.sampleRateConversion, self.stop, previewDb)
+        job.signals.previewLoaded.connect(self.jobPreviewLoaded)
+        job.signals.loaded.connect(self.jobLoaded)
+        job.signals.peaksLoaded.connect(self.jobPeaksLoaded)
+        job.signals.failed.connect(self.jobFailed)
+        self.pool.start(job)
+
+    def prefetch(self, filePaths):
+        self.prefetchStop.set()
+        self.prefetchStop = Event()
+        if filePaths:
+            self.prefetchPool.start(PrefetchJob(filePaths, self.peakCache, self.player.sampleRate, self.player.sampleRateConversion, self.prefetchStop))
+
+    def cancel(self):
+        self.stop.set()
+
+    def jobPreviewLoaded(self, requestId, preview):
+        if requestId != self.requestId:
+            return
+        self.previewLoaded.emit(self.filePath, preview, self.draw, self.play)
+
+    def jobLoaded(self, requestId, waveStream):
+        if requestId != self.requestId:
+            return
+        self.loaded.emit(self.filePath, waveStream)
+
+    def jobPeaksLoaded(self, requestId, peaks):
+        if requestId != self.requestId:
+            return
+        self.peaksLoaded.emit(self.filePath, peaks)
+
+    def jobFailed(self, requestId):
+        if requestId != self.requestId:
+            return
+        self.failed.emit(self.filePath)
@@ -148,7 +148,12 @@ class DbTreeView(TreeViewWithLines):
                 sampleRates = True
                 channels = 0
                 scanLimits = None, None, None, None
-            res = ImportDialogScanDnD(self.main, dirList, fileList, scanMode, formats, sampleRates, channels, scanLimits, tag).exec_()
+            scanDialog = ImportDialogScanDnD(self.main, dirList, fileList, scanMode, formats, sampleRates, channels, scanLimits, tag)
+            res = scanDialog.exec_()
+            if scanDialog.changedSamples:
+                self.main.applyChangedSamples(scanDialog.changedSamples)
+            if scanDialog.missingPaths:
+                self.main.removeMissingSamples(scanDialog.missingPaths)
             if not res:
                 return
             self.samplesImported.emit([(filePath, fileName, info, tags) for (filePath, fileName, info, tags) in res], currentTagIndex)
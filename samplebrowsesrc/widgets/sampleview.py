@@ -1,8 +1,8 @@
-import soundfile
 from PyQt5 import QtCore, QtGui, QtWidgets
 
 from samplebrowsesrc.utils import HoverDecorator, sizeStr
 from samplebrowsesrc.constants import *
+from samplebrowsesrc.probe import sampleInfo
 
 @HoverDecorator
 class SampleView(QtWidgets.QTableView):
@@ -32,7 +32,7 @@ class SampleView(QtWidgets.QTableView):
                     tagsText = ''
                 try:
                     if not info:
-                        info = soundfile.info(filePath)
+                        info = sampleInfo(filePath)
                     self.fileReadable.emit(fileIndex, True)
                     size = QtCore.QFileInfo(filePath).size()
                     self.setToolTip('''
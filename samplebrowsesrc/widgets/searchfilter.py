@@ -8,6 +8,8 @@ from samplebrowsesrc.utils import HoverDecorator, timeStr
 
 rangeData = namedtuple('rangeData', 'greater less')
 contextData = namedtuple('contextData', 'full short')
+#milliseconds without changes before filters are applied
+filterDelay = 150
 
 class FilterCloseButton(QtWidgets.QAbstractButton):
     backgroundOut = QtCore.Qt.darkGray
@@ -726,6 +728,12 @@ class MainFilterWidget(QtWidgets.QWidget):
         self.filterData = []
         layout.addWidget(self.filterWidget, 1, 1)
 
+        #changes are emitted together once typing pauses
+        self.filterTimer = QtCore.QTimer(self)
+        self.filterTimer.setSingleShot(True)
+        self.filterTimer.setInterval(filterDelay)
+        self.filterTimer.timeout.connect(self.emitFilters)
+
         self.addFilterBtn = HoverDecorator(QtWidgets.QToolButton)()
         self.addFilterBtn.setHoverText('Add search filters')
         self.addFilterBtn.setText('+')
@@ -789,8 +797,11 @@ class MainFilterWidget(QtWidgets.QWidget):
 
     def updateFilters(self, filterData):
         self.filterData = filterData
-        self.filtersChanged.emit([(fileNameColumn, self.nameSearchEdit.text())] + filterData)
+        self.filterTimer.start()
 
     def textSearchChanged(self, text):
-        self.filtersChanged.emit([(fileNameColumn, text)] + self.filterData)
+        self.filterTimer.start()
+
+    def emitFilters(self):
+        self.filtersChanged.emit([(fileNameColumn, self.nameSearchEdit.text())] + self.filterData)
 
@@ -3,6 +3,31 @@ from PyQt5 import QtCore, QtGui, QtWidgets
 
 from samplebrowsesrc.utils import HoverDecorator
 
+def envelopePath(mins, maxs, offset=0):
+    #the envelope is a single closed polygon (maxima left to right, then
+    #minima right to left), its coordinates are written directly in the
+    #QPolygonF memory instead of calling lineTo() for each point
+    points = len(maxs)
+    size = points * 2 + 2
+    polygon = QtGui.QPolygonF(size)
+    pointer = polygon.data()
+    pointer.setsize(size * 2 * np.dtype(np.float64).itemsize)
+    coords = np.frombuffer(pointer, dtype=np.float64).reshape(size, 2)
+    xPos = np.arange(points, dtype=np.float64)
+    coords[0] = 0, 0
+    coords[1:points + 1, 0] = xPos
+    coords[1:points + 1, 1] = maxs
+    coords[points + 1] = points, 0
+    coords[points + 2:, 0] = xPos[::-1]
+    coords[points + 2:, 1] = mins[::-1]
+    if offset:
+        coords[:, 1] += offset
+    path = QtGui.QPainterPath()
+    path.addPolygon(polygon)
+    path.closeSubpath()
+    return path
+
+
 class WaveScene(QtWidgets.QGraphicsScene):
     _orange = QtGui.QColor()
     _orange.setNamedColor('orangered')
@@ -56,7 +81,7 @@ class WaveScene(QtWidgets.QGraphicsScene):
         self.playhead.setX((secs) * self.sampleRate / self.realStep + self.deltaPos)
 #        self.playhead.setX(self.playhead.x() + sampleRate * .05 / self.realStep)
 
-    def drawWave(self, waveData, width):
+    def drawWave(self, peaks, width):
         self.deltaPos = 0
         self.clear()
         self.cursorPlayhead = self.addLine(0, -100, 0, 100, self.cursorPlayheadPen)
@@ -64,53 +89,17 @@ class WaveScene(QtWidgets.QGraphicsScene):
         self.playhead = self.addLine(0, -100, 0, 100, self.playheadPen)
         self.playhead.setZValue(100)
 
-        samples, channels = waveData.shape
-        #resolution is 5 samples per scene pixel
-        step = samples//(width*5)
+        channels = peaks.channels
+        mins, maxs, step = peaks.envelope(width)
         self.realStep = step
 
-        path = QtGui.QPainterPath()
-        path.moveTo(0, 0)
-        pos = 0
-        leftData = waveData[:, 0]
-        leftMin = np.amin(np.pad(leftData, (0, step - leftData.size % step), mode='constant', constant_values=0).reshape(-1, step), axis=1)
-        leftMax = np.amax(np.pad(leftData, (0, step - leftData.size % step), mode='constant', constant_values=0).reshape(-1, step), axis=1)
-        for value in leftMax:
-            path.lineTo(pos, value)
-            pos += 1
-        path.lineTo(pos, 0)
-        path.moveTo(0, 0)
-        pos = 0
-        for value in leftMin:
-            path.lineTo(pos, value)
-            pos += 1
-        path.lineTo(pos, 0)
-        path.closeSubpath()
-        leftPath = self.addPath(path, self.wavePen, self.waveBrush)
+        leftPath = self.addPath(envelopePath(mins[:, 0], maxs[:, 0]), self.wavePen, self.waveBrush)
         self.addLine(0, 0, leftPath.boundingRect().width(), 0, self.zeroPen)
         if channels == 1:
             self.waveRect = QtCore.QRectF(0, -1, leftPath.boundingRect().width(), 2)
             return
 
-        path = QtGui.QPainterPath()
-        path.moveTo(0, 0)
-        pos = 0
-        rightData = waveData[:, 1]
-        rightMin = np.amin(np.pad(rightData, (0, step - rightData.size % step), mode='constant', constant_values=0).reshape(-1, step), axis=1)
-        rightMax = np.amax(np.pad(rightData, (0, step - rightData.size % step), mode='constant', constant_values=0).reshape(-1, step), axis=1)
-        for value in rightMax:
-            path.lineTo(pos, value)
-            pos += 1
-        path.lineTo(pos, 0)
-        path.moveTo(0, 0)
-        pos = 0
-        for value in rightMin:
-            path.lineTo(pos, value)
-            pos += 1
-        path.lineTo(pos, 0)
-        path.closeSubpath()
-        path.translate(0, 2)
-        rightPath = self.addPath(path, self.wavePen, self.waveBrush)
+        rightPath = self.addPath(envelopePath(mins[:, 1], maxs[:, 1], 2), self.wavePen, self.waveBrush)
         self.addLine(0, 2, rightPath.boundingRect().width(), 2, self.zeroPen)
 
         leftText = self.addText('L')
@@ -184,9 +173,9 @@ class WaveView(QtWidgets.QGraphicsView):
         self.playerFrame.hide()
         self.setEnabled(False)
 
-    def drawWave(self, waveData):
+    def drawWave(self, peaks):
         self.setEnabled(True)
-        self.waveScene.drawWave(waveData, self.viewport().rect().width())
+        self.waveScene.drawWave(peaks, self.viewport().rect().width())
         self.fitInView(self.waveScene.waveRect)
         self.playerFrame.show()
         self.playerFrame.move(self.width() - self.playerFrame.width(), self.height() - self.playerFrame.height())